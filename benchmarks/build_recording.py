@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import shutil
+
+from src.config.config import logger, CANDIDATE_LIMIT, WIKIDATA_API_URL, WIKIDATA_SPARQL_URL
+from src.config.query import build_class_query, build_superclass_query
+from src.util.cassette import Cassette, BLOBS_DIR, KEYS_DIR
+from src.util.wikidata_backend import entities_params, search_params
+
+from benchmarks.run import BENCHMARK_DIR, RECORDING_DIR
+
+FIXTURE_FILE = os.path.join(BENCHMARK_DIR, "fixture.json")
+ENTITY_URI = "http://www.wikidata.org/entity/"
+
+
+# Writes the hand-built recording: the responses Wikidata would give for the
+# fixture's entities, stored under the same keys as a live recording. Batched
+# lookups are stored per ID, so one request per ID covers any grouping.
+def build(fixture, cassette):
+    language = fixture["language"]
+    entities = fixture["entities"]
+    for term, qids in fixture["searches"].items():
+        cassette.record(
+            WIKIDATA_API_URL,
+            search_params(term, language, CANDIDATE_LIMIT),
+            {"search": [{"id": qid, "label": entities[qid]["label"]} for qid in qids]},
+        )
+    for qid, entity in entities.items():
+        cassette.record(
+            WIKIDATA_API_URL,
+            entities_params([qid], language),
+            {
+                "entities": {
+                    qid: {
+                        "id": qid,
+                        "labels": {language: {"language": language, "value": entity["label"]}},
+                        "aliases": {
+                            language: [
+                                {"language": language, "value": alias} for alias in entity["aliases"]
+                            ]
+                        },
+                    }
+                }
+            },
+        )
+        bindings = [
+            {"item": {"value": ENTITY_URI + qid}, "class": {"value": ENTITY_URI + cls}}
+            for cls in entity["classes"]
+        ]
+        cassette.record(
+            WIKIDATA_SPARQL_URL,
+            {"query": build_class_query([qid])},
+            {"results": {"bindings": bindings}},
+        )
+    for cls, superclasses in fixture["superclasses"].items():
+        bindings = [
+            {"class": {"value": ENTITY_URI + cls}, "superclass": {"value": ENTITY_URI + superclass}}
+            for superclass in superclasses
+        ]
+        cassette.record(
+            WIKIDATA_SPARQL_URL,
+            {"query": build_superclass_query([cls])},
+            {"results": {"bindings": bindings}},
+        )
+
+
+def check(fixture):
+    # Every QID that get_entities, get_classes or get_superclasses can be asked
+    # about must have a recorded answer, or strict replay fails mid-run
+    entities = fixture["entities"]
+    superclasses = fixture["superclasses"]
+    problems = [
+        f"search {term!r} returns unknown entity {qid}"
+        for term, qids in fixture["searches"].items()
+        for qid in qids
+        if qid not in entities
+    ]
+    frontier = {cls for entity in entities.values() for cls in entity["classes"]}
+    seen = set()
+    while frontier:
+        seen.update(frontier)
+        frontier = {
+            superclass for qid in frontier for superclass in superclasses.get(qid, ())
+        } - seen
+    problems.extend(
+        f"{qid} has no P279 entry in superclasses"
+        for qid in sorted(seen - set(superclasses))
+    )
+    if problems:
+        raise ValueError("Incomplete benchmark fixture:\n  " + "\n  ".join(problems))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build the benchmark recording from the hand-built Wikidata fixture."
+    )
+    parser.add_argument("--fixture", default=FIXTURE_FILE)
+    parser.add_argument("--recording", default=RECORDING_DIR)
+    args = parser.parse_args(argv)
+
+    with open(args.fixture, mode="r", encoding="utf-8") as file:
+        fixture = json.load(file)
+    check(fixture)
+    # Rebuilt from scratch, so requests dropped from the fixture don't linger
+    for directory in (KEYS_DIR, BLOBS_DIR):
+        shutil.rmtree(os.path.join(args.recording, directory), ignore_errors=True)
+    cassette = Cassette(args.recording, mode="record")
+    build(fixture, cassette)
+    stats = cassette.stats()
+    logger.info(
+        f"Wrote {stats[KEYS_DIR]} requests ({stats[BLOBS_DIR]} distinct responses) to {args.recording}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import sys
+
+# (section, benchmark, statistic) shown side by side
+ROWS = (
+    ("pipeline", "latency", "p50_ms"),
+    ("pipeline", "latency", "p90_ms"),
+    ("pipeline", "latency", "p99_ms"),
+    ("pipeline", "docs_per_second", None),
+    ("pipeline", "batch_docs_per_second", None),
+    ("ranking", "rank_properties_with_bert", "p50_ms"),
+    ("ranking", "rank_properties_batch", "p50_ms"),
+    ("ranking", "rank_embeddings", "p50_ms"),
+    ("constraints", "match_with_constraints", "p50_ms"),
+    ("linking", "score_cold", "p50_ms"),
+    ("linking", "score_warm", "p50_ms"),
+    ("linking", "get_wikidata_qids", "p50_ms"),
+    ("loading", "property_data", "p50_ms"),
+    ("loading", "property_index", "p50_ms"),
+    ("loading", "constraint_index", "p50_ms"),
+)
+
+
+def _value(report, section, name, statistic):
+    value = report["results"].get(section, {}).get(name)
+    if statistic is not None:
+        value = (value or {}).get(statistic)
+    return value
+
+
+def compare(base, new):
+    # Timing table of two result files, and the documents whose triples differ
+    lines = [f"{'benchmark':<55} {'base':>12} {'new':>12} {'ratio':>8}"]
+    for section, name, statistic in ROWS:
+        label = ".".join(part for part in (section, name, statistic) if part)
+        old_value = _value(base, section, name, statistic)
+        new_value = _value(new, section, name, statistic)
+        ratio = f"{new_value / old_value:.2f}x" if old_value and new_value is not None else "-"
+        lines.append(f"{label:<55} {str(old_value):>12} {str(new_value):>12} {ratio:>8}")
+
+    base_triples = base["triples"]["documents"]
+    new_triples = new["triples"]["documents"]
+    changed = sorted(
+        doc_id
+        for doc_id in base_triples.keys() | new_triples.keys()
+        if base_triples.get(doc_id) != new_triples.get(doc_id)
+    )
+    return "\n".join(lines), changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare two benchmark result files; exits with 1 when the triples differ."
+    )
+    parser.add_argument("base")
+    parser.add_argument("new")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for path in (args.base, args.new):
+        with open(path, mode="r", encoding="utf-8") as file:
+            reports.append(json.load(file))
+    base, new = reports
+
+    if base["corpus"]["sha256"] != new["corpus"]["sha256"]:
+        print("Warning: the results were produced on different corpora.")
+    print(f"base: {base['commit']} ({base['timestamp']})")
+    print(f"new:  {new['commit']} ({new['timestamp']})")
+    table, changed = compare(base, new)
+    print(table)
+
+    if changed:
+        print(f"Triples differ in {len(changed)} documents:")
+        for doc_id in changed:
+            print(f"  {doc_id}")
+            print(f"    base: {base['triples']['documents'].get(doc_id)}")
+            print(f"    new:  {new['triples']['documents'].get(doc_id)}")
+        sys.exit(1)
+    print(f"Triples identical ({new['triples']['count']} triples).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from src import pipeline
+from src.config import config
+from src.config.config import logger
+from src.steps import coreference_resolver, ner_processor
+from src.steps.relationship_extraction import constraints_matching
+from src.steps.relationship_extraction.class_hierarchy import ClassHierarchy
+from src.steps.relationship_extraction.constraints_matching import (
+    ConstraintIndex,
+    match_with_constraints,
+)
+from src.steps.relationship_extraction.property_ranking import (
+    encode_clauses,
+    rank_embeddings,
+    rank_properties_batch,
+    rank_properties_with_bert,
+)
+from src.steps.relationship_extraction.relationship_extractor import build_clause
+from src.util import embedding_cache, embedding_store, qid_retriever, registry
+from src.util.cassette import Cassette, KEYS_DIR, set_cassette
+from src.util.corpus import iter_jsonl
+from src.util.data_loader import load_property_data
+from src.util.metrics import metrics
+from src.util.wikidata_backend import RemoteBackend, set_backend
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_FILE = os.path.join(BENCHMARK_DIR, "corpus.jsonl")
+RECORDING_DIR = os.path.join(BENCHMARK_DIR, "recordings")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+# Configuration that changes what or how fast the pipeline computes
+CONFIG_KEYS = (
+    "BERT_MODEL",
+    "SPACY_MODEL",
+    "NER_MODEL",
+    "TOP_K",
+    "MAX_DEPTH",
+    "DOC_BATCH_SIZE",
+    "SHARED_PARSE",
+    "LINKING_WORKERS",
+    "ANN_BACKEND",
+    "ANN_CANDIDATES",
+    "EMBEDDING_QUANTIZATION",
+    "RERANK_CANDIDATES",
+    "ENCODE_BATCH_SIZE",
+)
+# Constraint matching is too fast to time one call at a time
+MATCH_LOOPS = 200
+
+
+def reset_state():
+    # Every repetition starts from the same cold caches, so timings and triples
+    # don't depend on what an earlier repetition (or an earlier run) left behind.
+    # The backend keeps no cache and is shared by the whole run.
+    qid_retriever.QID_CACHE_ENABLED = False
+    embedding_cache.embedding_cache = embedding_cache.EmbeddingCache()
+    constraints_matching.class_hierarchy = ClassHierarchy(path=None)
+
+
+def summarize(seconds):
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"n": 0}
+    return {
+        "n": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": None if status is None else bool(status),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "platform": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+        },
+        "config": {key: getattr(config, key) for key in CONFIG_KEYS},
+    }
+
+
+def bench_loading(repeat):
+    # Fresh loads of the data files behind the registry resources; the models are
+    # loaded once through the registry, which reports their load times
+    samples = {"property_data": [], "property_index": [], "constraint_index": []}
+    for _ in range(repeat):
+        seconds, (_, constraints) = _timed(load_property_data)
+        samples["property_data"].append(seconds)
+        if embedding_store.exists():
+            seconds, _ = _timed(embedding_store.load_store)
+            samples["property_index"].append(seconds)
+        seconds, _ = _timed(ConstraintIndex, constraints)
+        samples["constraint_index"].append(seconds)
+    results = {name: summarize(seconds) for name, seconds in samples.items()}
+    results["registry"] = registry.warmup()
+    return results
+
+
+def bench_pipeline(documents, repeat):
+    ids = [doc_id for doc_id, _ in documents]
+    texts = [text for _, text in documents]
+    latencies, throughputs, outputs = [], [], []
+    for _ in range(repeat):
+        reset_state()
+        triples = []
+        for text in texts:
+            seconds, result = _timed(pipeline.extract_triples, text)
+            latencies.append(seconds)
+            triples.append(result)
+        outputs.append(triples)
+
+        reset_state()
+        seconds, batch_triples = _timed(pipeline.extract_triples_batch, texts)
+        throughputs.append(len(texts) / seconds)
+        outputs.append(batch_triples)
+
+    triples = {
+        doc_id: [list(triple) for triple in result] for doc_id, result in zip(ids, outputs[0])
+    }
+    return {
+        "latency": summarize(latencies),
+        "docs_per_second": round(len(latencies) / sum(latencies), 3),
+        "batch_docs_per_second": round(float(np.median(throughputs)), 3),
+        # Single-document and batched runs of every repetition agree
+        "deterministic": all(output == outputs[0] for output in outputs),
+    }, triples
+
+
+def linked_spos(texts):
+    # Inputs of the microbenchmarks: the linked SPOs of the corpus, the classes of
+    # their entities and every distinct entity mention
+    reset_state()
+    tagged = ner_processor.process_batch(coreference_resolver.process_batch(texts))
+    linked_batch, classes = pipeline.link_spos(tagged)
+    linked = [spo for spos in linked_batch for spo in spos]
+    spos = [spo for spo in linked if spo[1] is not None and spo[4] is not None]
+    mentions = list(dict.fromkeys(m for subj, _, _, obj, _ in linked for m in (subj, obj)))
+    return spos, classes, mentions
+
+
+def bench_ranking(spos, repeat):
+    property_index = registry.get("property_index")
+    clauses = [build_clause(subj, pred, obj) for subj, _, pred, obj, _ in spos]
+    preds = [pred for _, _, pred, _, _ in spos]
+
+    single, batch, ranking_only = [], [], []
+    for _ in range(repeat):
+        reset_state()
+        for clause, pred in zip(clauses, preds):
+            seconds, _ = _timed(rank_properties_with_bert, clause, pred, property_index)
+            single.append(seconds)
+        reset_state()
+        seconds, _ = _timed(rank_properties_batch, clauses, preds, property_index)
+        batch.append(seconds)
+        # Scoring alone, on embeddings encoded beforehand
+        clause_embs, pred_embs = encode_clauses(clauses, preds)
+        seconds, _ = _timed(rank_embeddings, clause_embs, pred_embs, property_index)
+        ranking_only.append(seconds)
+    return {
+        "clauses": len(clauses),
+        "rank_properties_with_bert": summarize(single),
+        "rank_properties_batch": summarize(batch),
+        "rank_embeddings": summarize(ranking_only),
+    }
+
+
+def bench_constraints(spos, classes, repeat):
+    constraint_index = registry.get("constraint_index")
+    pairs = [(classes[subj_qid], classes[obj_qid]) for _, subj_qid, _, _, obj_qid in spos]
+    samples = []
+    for _ in range(repeat):
+        for subject_classes, object_classes in pairs:
+            start = time.perf_counter()
+            for _ in range(MATCH_LOOPS):
+                match_with_constraints(constraint_index, subject_classes, object_classes)
+            samples.append((time.perf_counter() - start) / MATCH_LOOPS)
+    return {"pairs": len(pairs), "match_with_constraints": summarize(samples)}
+
+
+def bench_linking(mentions, repeat):
+    reset_state()
+    candidates = {mention: qid_retriever._get_candidates(mention, "en") for mention in mentions}
+    scored_mentions = [
+        (mention.lower().strip(), *candidates[mention])
+        for mention in mentions
+        if candidates[mention][0]
+    ]
+
+    cold, warm, end_to_end = [], [], []
+    for _ in range(repeat):
+        reset_state()
+        seconds, _ = _timed(qid_retriever._score, scored_mentions)
+        cold.append(seconds)
+        # Same texts again: candidate embeddings now come from the embedding cache
+        seconds, _ = _timed(qid_retriever._score, scored_mentions)
+        warm.append(seconds)
+        reset_state()
+        seconds, _ = _timed(qid_retriever.get_wikidata_qids, mentions)
+        end_to_end.append(seconds)
+    return {
+        "mentions": len(mentions),
+        "scored_mentions": len(scored_mentions),
+        "candidates": sum(len(c) for _, c, _ in scored_mentions),
+        "score_cold": summarize(cold),
+        "score_warm": summarize(warm),
+        "get_wikidata_qids": summarize(end_to_end),
+    }
+
+
+def triples_digest(triples):
+    return hashlib.sha256(json.dumps(triples, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def run(corpus=CORPUS_FILE, recording_dir=RECORDING_DIR, record=False, repeat=3):
+    with open(corpus, mode="rb") as file:
+        corpus_sha = hashlib.sha256(file.read()).hexdigest()
+    documents = list(iter_jsonl(corpus))
+    texts = [text for _, text in documents]
+
+    # Strict replay: a request missing from the recording fails instead of going live
+    cassette = Cassette(recording_dir, mode="record" if record else "replay", strict=True)
+    if not record and next(cassette.objects(KEYS_DIR), None) is None:
+        raise FileNotFoundError(
+            f"No recording in {recording_dir}; build one with `python -m benchmarks.build_recording` "
+            "or record one with `python -m benchmarks.run --record`"
+        )
+    previous = set_cassette(cassette)
+    # The recording holds remote API responses, whatever WIKIDATA_BACKEND says
+    backend = RemoteBackend()
+    previous_backend = set_backend(backend)
+    try:
+        # A recording run only needs to see every request once
+        repeat = 1 if record else repeat
+        results = {"loading": bench_loading(repeat)}
+        metrics.reset()
+        results["pipeline"], triples = bench_pipeline(documents, repeat)
+        snapshot = metrics.snapshot()
+
+        spos, classes, mentions = linked_spos(texts)
+        results["ranking"] = bench_ranking(spos, repeat)
+        results["constraints"] = bench_constraints(spos, classes, repeat)
+        results["linking"] = bench_linking(mentions, repeat)
+    finally:
+        set_backend(previous_backend)
+        backend.close()
+        set_cassette(previous)
+    if record:
+        logger.info(f"Recorded {cassette.stats()[KEYS_DIR]} responses in {recording_dir}")
+
+    return {
+        **environment(),
+        "corpus": {"path": os.path.relpath(corpus), "documents": len(documents), "sha256": corpus_sha},
+        "repeat": repeat,
+        "results": results,
+        "triples": {
+            "count": sum(len(doc_triples) for doc_triples in triples.values()),
+            "sha256": triples_digest(triples),
+            "documents": triples,
+        },
+        "metrics": snapshot,
+    }
+
+
+def default_output():
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    return os.path.join(RESULTS_DIR, f"{commit}.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline offline on a fixed corpus with recorded Wikidata responses."
+    )
+    parser.add_argument("--corpus", default=CORPUS_FILE)
+    parser.add_argument("--recording", default=RECORDING_DIR)
+    parser.add_argument(
+        "--record", action="store_true", help="Query the live endpoints and record their responses"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help=f"Results file (default: {RESULTS_DIR}/<commit>.json)")
+    args = parser.parse_args(argv)
+
+    report = run(args.corpus, args.recording, args.record, args.repeat)
+    output = args.output or default_output()
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, mode="w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+    latency = report["results"]["pipeline"]["latency"]
+    logger.info(
+        f"extract_triples p50 {latency.get('p50_ms')} ms, p99 {latency.get('p99_ms')} ms; "
+        f"{report['triples']['count']} triples ({report['triples']['sha256'][:12]}). "
+        f"Results written to {output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
-from src import pipeline
+from src import cli
 
-text = ""
-
-triples = pipeline.extract_triples(text)
\ No newline at end of file
+if __name__ == "__main__":
+    cli.main()
@@ -0,0 +1,264 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from collections import deque
+
+from src.config.config import (
+    logger,
+    DOC_BATCH_SIZE,
+    PROGRESS_INTERVAL,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_MAX_BATCH,
+    SERVER_MAX_LATENCY,
+    SERVER_QUEUE_SIZE,
+    SERVER_REQUEST_TIMEOUT,
+)
+from src.util.corpus import iter_documents
+from src.util.metrics import metrics, serve_metrics
+from src.util.triple_writer import open_writer
+from src.util.worker_pool import WorkerPool
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, mode="r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+
+def _chunks(iterable, n):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Progress:
+
+    def __init__(self, docs=0, triples=0, interval=PROGRESS_INTERVAL):
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.interval = interval
+        self.initial_docs = docs
+        self.docs = docs
+        self.triples = triples
+        self.run_triples = 0
+
+    def update(self, docs, triples):
+        self.docs += docs
+        self.triples += triples
+        self.run_triples += triples
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        logger.info(
+            f"Processed {self.docs} documents, {self.triples} triples "
+            f"({(self.docs - self.initial_docs) / elapsed:.2f} docs/s, "
+            f"{self.run_triples / elapsed:.2f} triples/s)"
+        )
+
+
+def run(args):
+    # Imported here so that --help does not pay for loading the pipeline
+    from src import pipeline
+    from src.steps.relationship_extraction.class_hierarchy import class_hierarchy
+
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    checkpoint = None if args.restart else load_checkpoint(checkpoint_path)
+    if checkpoint:
+        logger.info(
+            f"Resuming after {checkpoint['offset']} documents from {checkpoint_path}"
+        )
+    else:
+        checkpoint = {"offset": 0, "output_bytes": 0, "triples": 0}
+
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port, args.metrics_host)
+
+    documents = iter_documents(args.input, args.input_format, args.text_field, args.id_field)
+    documents = itertools.islice(documents, checkpoint["offset"], None)
+
+    # Chunks are queued as they are handed out, so results (which come back
+    # in order) can be matched with their document IDs
+    queued = deque()
+
+    def shards():
+        for chunk in _chunks(documents, args.batch_size):
+            queued.append(chunk)
+            yield [text for _, text in chunk]
+
+    # Both modes produce ([(doc_id, triples)] to write, documents finished) steps.
+    # Streamed documents are written window by window; the checkpoint only moves
+    # past a document once all of it is written.
+    def batch_steps(results):
+        for triples_batch in results:
+            chunk = queued.popleft()
+            writes = [(doc_id, triples) for (doc_id, _), triples in zip(chunk, triples_batch)]
+            yield writes, len(chunk)
+
+    def stream_steps():
+        for doc_id, text in documents:
+            for triples in pipeline.extract_triples_stream(text):
+                if triples:
+                    yield [(doc_id, triples)], 0
+            yield [], 1
+
+    pool = None
+    if args.stream:
+        if args.workers > 1:
+            logger.warning("--stream processes one document at a time in-process; ignoring --workers.")
+        steps = stream_steps()
+    elif args.workers > 1:
+        pool = WorkerPool(args.workers, args.threads_per_worker, args.batch_size)
+        steps = batch_steps(pool.imap(shards()))
+    else:
+        steps = batch_steps(
+            pipeline.extract_triples_batch(texts, args.batch_size) for texts in shards()
+        )
+
+    writer = open_writer(args.output, args.format, checkpoint["output_bytes"])
+    progress = Progress(checkpoint["offset"], checkpoint["triples"])
+    pending_triples = 0
+    try:
+        for writes, finished in steps:
+            for doc_id, triples in writes:
+                writer.write(doc_id, triples)
+            output_bytes = writer.flush()
+            written = sum(len(triples) for _, triples in writes)
+            pending_triples += written
+
+            # Output is durable before the checkpoint that points past it
+            if finished:
+                checkpoint["output_bytes"] = output_bytes
+                checkpoint["offset"] += finished
+                checkpoint["triples"] += pending_triples
+                pending_triples = 0
+                save_checkpoint(checkpoint_path, checkpoint)
+            progress.update(finished, written)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+        class_hierarchy.save()
+
+    progress.report()
+    if args.metrics:
+        metrics.write_json(args.metrics)
+        logger.info(f"Metrics written to {args.metrics}")
+    if writer.skipped:
+        logger.warning(
+            f"Skipped {writer.skipped} triples without an IRI subject or predicate "
+            "in this run; use --format jsonl to keep them."
+        )
+    logger.info(f"Finished; triples written to {args.output}")
+
+
+def extract(args):
+    from src import pipeline
+    from src.steps.relationship_extraction.class_hierarchy import class_hierarchy
+
+    if args.stream:
+        for triples in pipeline.extract_triples_stream(args.text):
+            for triple in triples:
+                print(json.dumps(list(triple), ensure_ascii=False), flush=True)
+    else:
+        for triple in pipeline.extract_triples(args.text):
+            print(json.dumps(list(triple), ensure_ascii=False))
+    class_hierarchy.save()
+    if args.metrics:
+        metrics.write_json(args.metrics)
+
+
+def serve(args):
+    from src.server import serve as serve_forever
+
+    serve_forever(
+        args.host,
+        args.port,
+        args.socket,
+        args.max_batch,
+        args.max_latency_ms / 1000,
+        args.queue_size,
+        args.timeout,
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="text2kg", description="Extract Wikidata triples from text."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser(
+        "run", help="Stream a corpus through the pipeline with resumable checkpoints."
+    )
+    run_parser.add_argument("input", help="JSONL file, plain text file (one document per line) or directory of .txt files")
+    run_parser.add_argument("--output", "-o", required=True)
+    run_parser.add_argument("--format", choices=["auto", "nt", "ttl", "jsonl"], default="auto",
+                            help="Output format (default: from the output extension, else N-Triples)")
+    run_parser.add_argument("--input-format", choices=["auto", "jsonl", "text", "dir"], default="auto")
+    run_parser.add_argument("--text-field", default="text", help="JSONL field holding the text")
+    run_parser.add_argument("--id-field", default="id", help="JSONL field holding the document ID")
+    run_parser.add_argument("--batch-size", type=int, default=DOC_BATCH_SIZE)
+    run_parser.add_argument("--workers", type=int, default=1,
+                            help="Worker processes; each loads the models once (default: 1, in-process)")
+    run_parser.add_argument("--threads-per-worker", type=int,
+                            help="Torch threads per worker (default: CPU count / workers)")
+    run_parser.add_argument("--stream", action="store_true",
+                            help="Process each document in overlapping sentence windows and write "
+                            "triples as each window finishes (for book-length documents)")
+    run_parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    run_parser.add_argument("--restart", action="store_true",
+                            help="Ignore an existing checkpoint and overwrite the output")
+    run_parser.add_argument("--metrics", help="Write a JSON summary of stage timings and counters here")
+    run_parser.add_argument("--metrics-port", type=int,
+                            help="Serve Prometheus metrics on this port during the run")
+    run_parser.add_argument("--metrics-host", default=SERVER_HOST,
+                            help="Interface for --metrics-port (default: %(default)s; 0.0.0.0 for all)")
+    run_parser.set_defaults(func=run)
+
+    extract_parser = commands.add_parser("extract", help="Extract triples from a single text.")
+    extract_parser.add_argument("text")
+    extract_parser.add_argument("--stream", action="store_true",
+                                help="Print triples window by window (for long texts)")
+    extract_parser.add_argument("--metrics", help="Write a JSON summary of stage timings and counters here")
+    extract_parser.set_defaults(func=extract)
+
+    serve_parser = commands.add_parser(
+        "serve", help="Keep the models loaded and serve extraction requests over HTTP."
+    )
+    serve_parser.add_argument("--host", default=SERVER_HOST)
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT)
+    serve_parser.add_argument("--socket", help="Listen on this Unix socket instead of host:port")
+    serve_parser.add_argument("--max-batch", type=int, default=SERVER_MAX_BATCH,
+                              help="Documents per pipeline batch")
+    serve_parser.add_argument("--max-latency-ms", type=float, default=SERVER_MAX_LATENCY * 1000,
+                              help="How long the oldest queued document waits for a fuller batch")
+    serve_parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE,
+                              help="Queued documents before requests are rejected with 503")
+    serve_parser.add_argument("--timeout", type=float, default=SERVER_REQUEST_TIMEOUT,
+                              help="Seconds a request waits for its results")
+    serve_parser.set_defaults(func=serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
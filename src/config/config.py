@@ -1,4 +1,5 @@
 import logging
+import os
 
 # Configuration variables
 SPACY_MODEL = "en_core_web_sm"
@@ -8,12 +9,49 @@ PROPERTIES_FILE = "src/data/wikidata_properties.csv"
 CONSTRAINTS_FILE = "src/data/wikidata_constraints.csv"
 PROPERTIES_WITH_EMB_FILE = "src/data/properties_with_emb.pkl"
 CONSTRAINTS_WITH_EMB_FILE = "src/data/constraints_with_emb.pkl"
+EMBEDDING_STORE_DIR = "src/data/embedding_store"
+EMBEDDING_STORE_DTYPE = "float32"  # or "float16" to halve the store size
+PRECOMPUTE_BATCH_SIZE = 256  # texts per encoder forward pass when precomputing
+# Coarse property scoring on "int8" or "float16" copies of the embeddings, with
+# exact float32 re-ranking of the best RERANK_CANDIDATES; None scores exactly
+EMBEDDING_QUANTIZATION = None
+RERANK_CANDIDATES = 300
+QID_CACHE_FILE = "src/data/qid_cache.sqlite"
+LOCAL_WIKIDATA_DB = "src/data/wikidata_local.sqlite"
+CLASS_HIERARCHY_FILE = "src/data/class_hierarchy.json"
 
 MAX_DEPTH = 3
+CLOSURE_CACHE_SIZE = 100000  # class superclass closures kept in memory
 TOP_K = 5
+# Approximate property search: None (exact), "auto", "faiss", "hnswlib" or "ivf" (NumPy)
+ANN_BACKEND = None
+ANN_CANDIDATES = 200  # rows retrieved per query before reducing to TOP_K properties
+ANN_NLIST = None  # IVF clusters (default: sqrt(rows))
+ANN_NPROBE = 16  # IVF clusters scanned per query
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 128
+DOC_BATCH_SIZE = 32
+# Take clauses from the coreference parse instead of re-parsing the resolved text
+SHARED_PARSE = False
+PROGRESS_INTERVAL = 30  # seconds between throughput reports of a corpus run
+# Streaming mode for long documents (pipeline.extract_triples_stream)
+STREAM_WINDOW_SENTENCES = 8  # sentences per coreference/NER window, overlap included
+STREAM_OVERLAP_SENTENCES = 2  # sentences of context carried over from the previous window
+STREAM_BLOCK_CHARS = 20000  # characters split into sentences at a time
+STREAM_ENTITY_MEMORY = 32  # pronoun -> antecedent entries carried across windows
+STREAM_SEEN_TRIPLES = 10000  # recent triples kept to drop repeats across windows
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+SERVER_MAX_BATCH = 32  # documents per pipeline batch
+SERVER_MAX_LATENCY = 0.05  # seconds the oldest queued document waits for a fuller batch
+SERVER_QUEUE_SIZE = 256  # queued documents before requests are rejected with 503
+SERVER_REQUEST_TIMEOUT = 300  # seconds
 
 WIKIDATA_SPARQL_URL = "https://query.wikidata.org/sparql"
 WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+WIKIDATA_BACKEND = "remote"  # "remote" (API + SPARQL endpoint) or "local" (LOCAL_WIKIDATA_DB)
 
 DEFAULT_USER_AGENT = "Text2KG/1.0 (contact: marko.putnikovic@gmail.com)"
 USER_AGENTS = [
@@ -26,12 +64,40 @@ USER_AGENTS = [
 TIMEOUT = 30
 MAX_RETRIES = 3
 BASE_DELAY = 5  # seconds
+MAX_DELAY = 60  # seconds
+HTTP_MAX_CONNECTIONS = 20
+HTTP_CONCURRENCY = 8  # in-flight requests across all threads
+LINKING_WORKERS = 8  # threads resolving QIDs and classes concurrently
+MICRO_BATCH_WINDOW = 0.02  # seconds to gather lookups into one request
+CANDIDATE_LIMIT = 10  # wbsearchentities results per mention
+WBGETENTITIES_MAX_IDS = 50  # API limit per wbgetentities call
+CLASS_QUERY_MAX_IDS = 50  # QIDs per VALUES clause of a P31 query
 BATCH_SIZE = 25
 SLEEP_BETWEEN_BATCHES = 5  # seconds
 
+ENCODE_BATCH_SIZE = 32  # texts per encoder forward pass at run time
+EMBEDDING_CACHE_SIZE = 50000  # texts kept in memory
+EMBEDDING_CACHE_PERSIST = False  # also keep embeddings in EMBEDDING_CACHE_FILE
+EMBEDDING_CACHE_FILE = "src/data/embedding_cache.sqlite"
+
+# Record/replay of Wikidata HTTP responses: None (live requests), "record" or
+# "replay". Strict replay fails on unrecorded requests; otherwise they are sent
+# live and recorded. The TEXT2KG_CASSETTE* environment variables override these.
+HTTP_CASSETTE = os.environ.get("TEXT2KG_CASSETTE") or None
+HTTP_CASSETTE_DIR = os.environ.get("TEXT2KG_CASSETTE_DIR", "src/data/http_cassette")
+HTTP_CASSETTE_STRICT = os.environ.get("TEXT2KG_CASSETTE_STRICT", "1") != "0"
+
+QID_CACHE_ENABLED = True
+QID_CACHE_TTL = 30 * 24 * 3600  # seconds
+QID_CACHE_LRU_SIZE = 10000
+# Seconds a cache write waits for another process (e.g. a worker) holding the SQLite lock
+SQLITE_TIMEOUT = 30
+
 # Logger configuration
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
-logger = logging.getLogger("aied")
\ No newline at end of file
+logger = logging.getLogger("aied")
+# httpx logs every request at INFO level
+logging.getLogger("httpx").setLevel(logging.WARNING)
\ No newline at end of file
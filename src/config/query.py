@@ -50,13 +50,14 @@ CONSTRAINTS_QUERY_TEMPLATE = """
     """
 
 CLASS_QUERY_TEMPLATE = """
-        SELECT ?class WHERE {{
-        wd:{qid} wdt:P31 ?class .
+        SELECT ?item ?class WHERE {{
+        VALUES ?item {{ {qids} }}
+        ?item wdt:P31 ?class .
         }}
     """
 
 SUPERCLASS_QUERY_TEMPLATE = """
-    SELECT ?superclass WHERE {{
+    SELECT ?class ?superclass WHERE {{
         VALUES ?class {{ {qids} }}
         ?class wdt:P279 ?superclass .
     }}
@@ -65,8 +66,9 @@ SUPERCLASS_QUERY_TEMPLATE = """
 def build_constraints_query(values_clause: str) -> str:
     return CONSTRAINTS_QUERY_TEMPLATE.format(values_clause=values_clause)
 
-def build_class_query(qid: str) -> str:
-    return CLASS_QUERY_TEMPLATE.format(qid=qid)
+def build_class_query(qids: list) -> str:
+    qids_str = ' '.join(f'wd:{q}' for q in qids)
+    return CLASS_QUERY_TEMPLATE.format(qids=qids_str)
 
 def build_superclass_query(qids: list) -> str:
     qids_str = ' '.join(f'wd:{q}' for q in qids)
@@ -1,47 +1,97 @@
 import re
+from collections import OrderedDict
 
 from src.steps import coreference_resolver
 from src.steps import ner_processor
+from src.steps import sentence_windows
 from src.util import qid_retriever
-from src.util.data_loader import load_property_data, load_embedding_data
+from src.util import registry
 from src.steps.relationship_extraction import relationship_extractor
-
-from src.config.config import logger
-
-properties_data, constraints_data = load_property_data()
-properties_with_emb, constraints_with_emb = load_embedding_data()
-
-def extract_triples(text: str):
-
-    coref_resolved_text = coreference_resolver.process(text)
-    logger.info(f"Coreference Resolved Text: {coref_resolved_text}")
-
-    tagged_spos = ner_processor.process(coref_resolved_text)
-    logger.info(f"Extracted SPOS: {tagged_spos}")
-
+from src.steps.relationship_extraction.constraints_matching import get_classes
+from src.util.metrics import metrics
+from src.util.scheduler import scheduler
+
+from src.config.config import (
+    logger,
+    DOC_BATCH_SIZE,
+    SHARED_PARSE,
+    STREAM_WINDOW_SENTENCES,
+    STREAM_OVERLAP_SENTENCES,
+    STREAM_SEEN_TRIPLES,
+)
+
+
+def warmup():
+    # Loads every model and index up front instead of on the first document
+    return registry.warmup()
+
+
+def strip_tags(texts):
+    return [re.sub(r"</?[^>]+>", "", text) for text in texts]
+
+
+def link_spos(tagged_spos_batch):
+    spos_batch = [
+        [tuple(strip_tags(spo)) for spo in tagged_spos] for tagged_spos in tagged_spos_batch
+    ]
+
+    # Resolve every distinct mention of the batch once: candidate searches run
+    # concurrently and all candidates are scored together
+    mentions = [
+        mention for spos in spos_batch for subj, _, obj in spos for mention in (subj, obj)
+    ]
+    with metrics.timer("entity_linking"):
+        qids = qid_retriever.get_wikidata_qids(mentions)
+
+    linked_spos_batch = []
+    for spos in spos_batch:
+        linked_spos = []
+        for subj, pred, obj in spos:
+            logger.debug("Processing SPO: %s", (subj, pred, obj))
+            linked_spos.append((subj, qids[subj], pred, obj, qids[obj]))
+        linked_spos_batch.append(linked_spos)
+
+    # Then fetch the classes of every entity that takes part in relationship extraction
+    linked_qids = [
+        qid
+        for linked_spos in linked_spos_batch
+        for _, subj_qid, _, _, obj_qid in linked_spos
+        if subj_qid is not None and obj_qid is not None
+        for qid in (subj_qid, obj_qid)
+    ]
+    with metrics.timer("class_fetch"):
+        classes = scheduler.map_unique("classes", get_classes, linked_qids)
+
+    return linked_spos_batch, classes
+
+
+def build_triples(linked_spos, rankings, classes):
+
+    property_index = registry.get("property_index")
+    constraint_index = registry.get("constraint_index")
     triples = []
 
-    def strip_tags(texts):
-        return [re.sub(r"</?[^>]+>", "", text) for text in texts]
-
-    for spo in tagged_spos:
-        logger.info(f"Processing SPO: {spo}")
-
-        subj, pred, obj = strip_tags(spo)
-
-        subj_qid = qid_retriever.get_wikidata_qid(subj)
-        obj_qid = qid_retriever.get_wikidata_qid(obj)
+    for subj, subj_qid, pred, obj, obj_qid in linked_spos:
         subj_uri = f"http://www.wikidata.org/entity/{subj_qid}" if subj_qid else None
         obj_uri = f"http://www.wikidata.org/entity/{obj_qid}" if obj_qid else None
 
         if subj_qid is None or obj_qid is None:
-            logger.info("Skipping relationship extraction due to missing QID.")
+            logger.debug("Skipping relationship extraction due to missing QID.")
             triples.append((subj_uri if subj_uri else subj, pred, obj_uri if obj_uri else obj))
             continue
 
         best_bert_property, constraints_matching_candidates = (
             relationship_extractor.extract_relationship(
-                subj, subj_qid, obj, obj_qid, pred, properties_with_emb, constraints_with_emb
+                subj,
+                subj_qid,
+                obj,
+                obj_qid,
+                pred,
+                property_index,
+                constraint_index,
+                next(rankings),
+                classes[subj_qid],
+                classes[obj_qid],
             )
         )
 
@@ -49,12 +99,104 @@ def extract_triples(text: str):
 
         if best_bert_property and triple not in triples:
             triples.append(triple)
-            logger.info(
-                f"Extracted Triple: <{subj_uri}, {best_bert_property}, {obj_uri}>"
+            logger.debug(
+                "Extracted Triple: <%s, %s, %s>", subj_uri, best_bert_property, obj_uri
             )
         else:
-            logger.info("No suitable property found for the entity pair.")
+            logger.debug("No suitable property found for the entity pair.")
 
-    logger.info(f"Final Extracted Triples: {triples}")
+    logger.debug("Final Extracted Triples: %s", triples)
 
     return triples
+
+
+def extract_triples(text: str):
+    return extract_triples_batch([text])[0]
+
+
+def extract_triples_batch(texts, batch_size=DOC_BATCH_SIZE):
+    texts = list(texts)
+    results = []
+    for start in range(0, len(texts), batch_size):
+        results.extend(_extract_triples_chunk(texts[start : start + batch_size], batch_size))
+    return results
+
+
+def _extract_triples_chunk(texts, batch_size):
+
+    metrics.inc("documents", len(texts))
+    if SHARED_PARSE:
+        with metrics.timer("coref"):
+            parsed = coreference_resolver.parse_batch(texts, batch_size)
+        for _, coref_resolved_text, _ in parsed:
+            logger.debug("Coreference Resolved Text: %s", coref_resolved_text)
+
+        tagged_spos_batch = ner_processor.process_parsed_batch(parsed, batch_size)
+    else:
+        with metrics.timer("coref"):
+            coref_resolved_texts = coreference_resolver.process_batch(texts, batch_size)
+        for coref_resolved_text in coref_resolved_texts:
+            logger.debug("Coreference Resolved Text: %s", coref_resolved_text)
+
+        tagged_spos_batch = ner_processor.process_batch(coref_resolved_texts, batch_size)
+
+    return _triples_from_spos(tagged_spos_batch)
+
+
+def _triples_from_spos(tagged_spos_batch):
+    for tagged_spos in tagged_spos_batch:
+        logger.debug("Extracted SPOS: %s", tagged_spos)
+
+    linked_spos_batch, classes = link_spos(tagged_spos_batch)
+
+    # Rank every clause of the chunk against the property index in one pass
+    to_rank = [
+        (subj, pred, obj)
+        for linked_spos in linked_spos_batch
+        for subj, subj_qid, pred, obj, obj_qid in linked_spos
+        if subj_qid is not None and obj_qid is not None
+    ]
+    with metrics.timer("property_ranking"):
+        rankings = iter(
+            relationship_extractor.rank_relationships(to_rank, registry.get("property_index"))
+        )
+
+    with metrics.timer("triple_building"):
+        triples_batch = [
+            build_triples(linked_spos, rankings, classes) for linked_spos in linked_spos_batch
+        ]
+    metrics.inc("triples", sum(len(triples) for triples in triples_batch))
+    return triples_batch
+
+
+def extract_triples_stream(
+    text,
+    window=STREAM_WINDOW_SENTENCES,
+    overlap=STREAM_OVERLAP_SENTENCES,
+    max_seen=STREAM_SEEN_TRIPLES,
+):
+    # Long documents: text (a string, or an iterable of text chunks such as an
+    # open file) is processed in overlapping sentence windows, and the new
+    # triples of each window are yielded as soon as it is done. Memory is bounded
+    # by the window size, the entity memory and the max_seen recent triples used
+    # to drop repeats. Windows always take the resolved-text path (no SHARED_PARSE).
+    metrics.inc("documents")
+    memory = coreference_resolver.EntityMemory()
+    seen = OrderedDict()
+    sentences = sentence_windows.iter_sentences(text)
+    for context, new_sentences in sentence_windows.iter_windows(sentences, window, overlap):
+        metrics.inc("stream_windows")
+        with metrics.timer("coref"):
+            resolved_text = coreference_resolver.process_window(context, new_sentences, memory)
+        logger.debug("Coreference Resolved Window: %s", resolved_text)
+
+        new_triples = []
+        for triple in _triples_from_spos(ner_processor.process_batch([resolved_text]))[0]:
+            if triple in seen:
+                seen.move_to_end(triple)
+                continue
+            seen[triple] = None
+            if len(seen) > max_seen:
+                seen.popitem(last=False)
+            new_triples.append(triple)
+        yield new_triples
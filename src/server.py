@@ -0,0 +1,252 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from http.server import ThreadingHTTPServer
+
+from src.config.config import (
+    logger,
+    SERVER_MAX_BATCH,
+    SERVER_MAX_LATENCY,
+    SERVER_QUEUE_SIZE,
+    SERVER_REQUEST_TIMEOUT,
+)
+from src.util.metrics import metrics, MetricsHandler
+
+
+class ServerBusy(Exception):
+    pass
+
+
+# Queues documents from concurrent requests and runs them through the pipeline
+# in batches: a batch goes out when it is full or when its oldest document has
+# waited max_latency. The queue is bounded; submitting to a full queue raises
+# ServerBusy instead of letting latency grow without limit.
+class DocumentBatcher:
+
+    def __init__(
+        self,
+        extract_batch,
+        max_batch=SERVER_MAX_BATCH,
+        max_latency=SERVER_MAX_LATENCY,
+        max_queue=SERVER_QUEUE_SIZE,
+    ):
+        self.extract_batch = extract_batch
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.max_queue = max_queue
+        self._queue = []  # (arrival time, text, future)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="document-batcher", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queue)
+
+    def submit(self, texts):
+        # All documents of a request are queued together or not at all
+        with self._cond:
+            if self._closed:
+                raise ServerBusy("Server is shutting down")
+            if len(self._queue) + len(texts) > self.max_queue:
+                metrics.inc("server_rejected")
+                raise ServerBusy(f"Queue is full ({len(self._queue)}/{self.max_queue} documents)")
+            now = time.monotonic()
+            futures = [Future() for _ in texts]
+            self._queue.extend((now, text, future) for text, future in zip(texts, futures))
+            self._cond.notify()
+        return futures
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            deadline = self._queue[0][0] + self.max_latency
+            while len(self._queue) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._queue[: self.max_batch]
+            del self._queue[: self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Requests that timed out meanwhile are dropped from the batch
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            now = time.monotonic()
+            for arrival, _, _ in batch:
+                metrics.observe("server_queue_seconds", now - arrival)
+            metrics.observe("server_batch_size", len(batch))
+            try:
+                with metrics.timer("server_batch"):
+                    results = self.extract_batch([text for _, text, _ in batch])
+            except Exception as e:
+                logger.exception("Batch of %s documents failed", len(batch))
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), triples in zip(batch, results):
+                future.set_result(triples)
+
+    def close(self):
+        # Documents already queued are still processed
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+class ExtractionHandler(MetricsHandler):
+    # Set on the subclass built by make_server
+    batcher = None
+    request_timeout = SERVER_REQUEST_TIMEOUT
+
+    def send_json(self, status, payload, headers=None):
+        self.send_body(status, json.dumps(payload, ensure_ascii=False), "application/json", headers)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(
+                200, {"status": "ok", "queued": len(self.batcher), "max_queue": self.batcher.max_queue}
+            )
+        else:
+            super().do_GET()
+
+    def do_POST(self):
+        if self.path != "/extract":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+            single = "text" in payload
+            texts = [payload["text"]] if single else payload["texts"]
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("texts must be a list of strings")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": f'Expected {{"text": str}} or {{"texts": [str]}}: {e}'})
+            return
+        if len(texts) > self.batcher.max_queue:
+            self.send_json(413, {"error": f"At most {self.batcher.max_queue} texts per request"})
+            return
+
+        metrics.inc("server_requests")
+        try:
+            futures = self.batcher.submit(texts)
+        except ServerBusy as e:
+            self.send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            return
+
+        deadline = time.monotonic() + self.request_timeout
+        try:
+            results = [
+                [list(triple) for triple in future.result(max(0.0, deadline - time.monotonic()))]
+                for future in futures
+            ]
+        except TimeoutError:
+            for future in futures:
+                future.cancel()
+            self.send_json(504, {"error": f"No result within {self.request_timeout}s"})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, {"triples": results[0]} if single else {"results": results})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Clients on a Unix socket have no address; http.server expects a host
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def remove_stale_socket(socket_path):
+    # Only a socket nobody listens on (left behind by a server that died) is
+    # removed; a live server's socket or any other file at the path is an error
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket; choose another --socket path")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise FileExistsError(f"Another server is listening on {socket_path}")
+
+
+def make_server(batcher, host=None, port=None, socket_path=None, timeout=SERVER_REQUEST_TIMEOUT):
+    handler = type("Handler", (ExtractionHandler,), {"batcher": batcher, "request_timeout": timeout})
+    if socket_path:
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(
+    host,
+    port,
+    socket_path=None,
+    max_batch=SERVER_MAX_BATCH,
+    max_latency=SERVER_MAX_LATENCY,
+    max_queue=SERVER_QUEUE_SIZE,
+    timeout=SERVER_REQUEST_TIMEOUT,
+):
+    from src import pipeline
+    from src.steps.relationship_extraction.class_hierarchy import class_hierarchy
+
+    # Checked before the models load, which takes a while; make_server then
+    # binds to a free path
+    if socket_path:
+        remove_stale_socket(socket_path)
+    # Every model and index is loaded before the first request is accepted
+    pipeline.warmup()
+    batcher = DocumentBatcher(
+        lambda texts: pipeline.extract_triples_batch(texts, max_batch),
+        max_batch,
+        max_latency,
+        max_queue,
+    )
+    server = make_server(batcher, host, port, socket_path, timeout)
+    address = socket_path or f"http://{host}:{server.server_address[1]}"
+    logger.info(
+        f"Serving on {address} (POST /extract, GET /health, GET /metrics); "
+        f"batches of up to {max_batch} documents within {max_latency * 1000:.0f} ms, "
+        f"queue of {max_queue}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down.")
+    finally:
+        server.server_close()
+        batcher.close()
+        class_hierarchy.save()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -1,27 +1,125 @@
-import spacy
-from fastcoref import spacy_component
-from src.config.config import logger, SPACY_MODEL
+from collections import OrderedDict
 
-# Load spacy with fastcoref
-nlp = spacy.load(SPACY_MODEL)
-nlp.add_pipe("fastcoref")
+from src.config.config import logger, DOC_BATCH_SIZE, STREAM_ENTITY_MEMORY
+from src.util.registry import get_nlp
 
-def process(text: str):
+PRONOUNS = {
+    "he", "him", "his", "she", "her", "hers", "it", "its", "they", "them", "their", "theirs",
+}
+
+
+# Streaming mode: the antecedent each pronoun last referred to, so that a window
+# whose coreference cluster only holds pronouns (the name fell out of the window)
+# can still be resolved
+class EntityMemory:
+
+    def __init__(self, max_size=STREAM_ENTITY_MEMORY):
+        self.max_size = max_size
+        self._entities = OrderedDict()
+
+    def get(self, pronoun):
+        return self._entities.get(pronoun.lower())
+
+    def remember(self, pronoun, name):
+        pronoun = pronoun.lower()
+        self._entities[pronoun] = name
+        self._entities.move_to_end(pronoun)
+        while len(self._entities) > self.max_size:
+            self._entities.popitem(last=False)
 
-    doc = nlp(text)
+def _replacements(doc, text: str):
 
     replacements = []
 
     for cluster in doc._.coref_clusters:
         name = text[cluster[0][0] : cluster[0][1]]
-        logger.info(f"Name: {name}")
-        logger.info(f"Coreference cluster: {cluster}")
+        logger.debug("Name: %s", name)
+        logger.debug("Coreference cluster: %s", cluster)
 
         for i in range(1, len(cluster)):
             start, end = cluster[i][0], cluster[i][1]
             replacements.append((start, end, name))
 
-    logger.info(f"Replacements: {replacements}")
-    for start, end, name in sorted(replacements, key=lambda x: x[0], reverse=True):
-        text = text[:start] + name + text[end:]
-    return text
+    logger.debug("Replacements: %s", replacements)
+    return replacements
+
+def _apply(text: str, replacements):
+    # Single pass over the text; a mention nested in an already replaced one is skipped
+    pieces = []
+    pos = 0
+    for start, end, name in sorted(replacements, key=lambda x: x[0]):
+        if start < pos:
+            continue
+        pieces.append(text[pos:start])
+        pieces.append(name)
+        pos = end
+    pieces.append(text[pos:])
+    return "".join(pieces)
+
+def _resolve(doc, text: str):
+    return _apply(text, _replacements(doc, text))
+
+def resolve_doc(doc):
+    # Resolves coreference on the parsed Doc itself instead of re-parsing a rewritten
+    # string: each later mention's first token maps to the antecedent span and its
+    # remaining tokens map to nothing.
+    text = doc.text
+    replacements = _replacements(doc, text)
+
+    substitutions = {}
+    for cluster in doc._.coref_clusters:
+        antecedent = doc.char_span(*cluster[0], alignment_mode="expand")
+        if antecedent is None:
+            continue
+        for start, end in cluster[1:]:
+            mention = doc.char_span(start, end, alignment_mode="expand")
+            if mention is None or mention[0].i in substitutions:
+                continue
+            substitutions[mention[0].i] = antecedent
+            for token in mention[1:]:
+                substitutions.setdefault(token.i, ())
+
+    return _apply(text, replacements), substitutions
+
+def resolve_window(doc, start, memory):
+    # Resolves doc.text[start:] with the whole window (context sentences
+    # included) as coreference context; mentions before start are left out
+    text = doc.text
+    replacements = []
+    for cluster in doc._.coref_clusters:
+        name = text[cluster[0][0] : cluster[0][1]]
+        mentions = cluster[1:]
+        if name.lower() in PRONOUNS:
+            remembered = memory.get(name)
+            if remembered is None:
+                continue
+            logger.debug("Resolved '%s' from the entity memory: %s", name, remembered)
+            name, mentions = remembered, cluster
+        for mention_start, mention_end in mentions:
+            mention = text[mention_start:mention_end]
+            if mention.lower() in PRONOUNS:
+                memory.remember(mention, name)
+            if mention_start >= start:
+                replacements.append((mention_start - start, mention_end - start, name))
+    return _apply(text[start:], replacements)
+
+def process_window(context, sentences, memory):
+    text = " ".join(context + sentences)
+    start = len(" ".join(context)) + 1 if context else 0
+    return resolve_window(get_nlp()(text), start, memory)
+
+def process(text: str):
+    return _resolve(get_nlp()(text), text)
+
+def process_batch(texts, batch_size=DOC_BATCH_SIZE):
+    return [
+        _resolve(doc, text)
+        for doc, text in zip(get_nlp().pipe(texts, batch_size=batch_size), texts)
+    ]
+
+def parse_batch(texts, batch_size=DOC_BATCH_SIZE):
+    # One parse per text for the shared-parse mode: (doc, resolved_text, substitutions)
+    return [
+        (doc, *resolve_doc(doc))
+        for doc in get_nlp().pipe(texts, batch_size=batch_size)
+    ]
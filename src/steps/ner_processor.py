@@ -1,17 +1,20 @@
-import spacy
-from transformers import pipeline
+from src.config.config import logger, DOC_BATCH_SIZE
+from src.util.metrics import metrics
+from src.util.registry import get_ner, get_nlp
 
-from src.config.config import logger, NER_MODEL, SPACY_MODEL
+# The shared spaCy pipeline also carries fastcoref, which clause extraction does not need
+DISABLED_PIPES = ["fastcoref"]
 
-ner = pipeline(
-    "ner",
-    model=NER_MODEL,
-    grouped_entities=True,
-)
+def _expand(tokens, substitutions):
+    # Replaces coreferent mentions with their antecedent's tokens (shared-parse mode)
+    for t in tokens:
+        if t.i in substitutions:
+            yield from substitutions[t.i]
+        else:
+            yield t
 
-nlp = spacy.load(SPACY_MODEL)
-
-def extract_spos(sent_doc):
+def extract_spos(sent_doc, substitutions=None):
+    substitutions = substitutions or {}
     spos = []
     root = next((t for t in sent_doc if t.dep_ == "ROOT"), None)
     if not root:
@@ -31,28 +34,28 @@ def extract_spos(sent_doc):
             objects.extend([c for c in t.children if c.dep_ == "pobj"])
 
     for subj in subjects:
-        subj_text = " ".join([t.text for t in subj.subtree])
+        subj_tokens = list(_expand(subj.subtree, substitutions))
+        subj_text = " ".join([t.text for t in subj_tokens])
         for obj in objects:
-            obj_text = " ".join([t.text for t in obj.subtree])
+            obj_tokens = list(_expand(obj.subtree, substitutions))
+            obj_text = " ".join([t.text for t in obj_tokens])
             # only keep if they look like arguments
-            if any(t.pos_ in ("NOUN", "PROPN") for t in subj.subtree) and \
-               any(t.pos_ in ("NOUN", "PROPN") for t in obj.subtree):
+            if any(t.pos_ in ("NOUN", "PROPN") for t in subj_tokens) and \
+               any(t.pos_ in ("NOUN", "PROPN") for t in obj_tokens):
                 spos.append((subj_text.strip(), root.lemma_, obj_text.strip()))
 
     return spos
 
-def process(text: str):
-    # First perform NER on the entire text for better context
+def _tag_spos(entities, doc, substitutions=None):
     named_entities = [
         (ent["word"], ent["entity_group"], ent["start"], ent["end"])
-        for ent in ner(text)
+        for ent in entities
     ]
-    logger.info(f"Extracted Entities: {named_entities}")
-    doc = nlp(text)
+    logger.debug("Extracted Entities: %s", named_entities)
     extracted_spos = []
 
     for sent in doc.sents:
-        extracted_spos.extend(extract_spos(sent))
+        extracted_spos.extend(extract_spos(sent, substitutions))
     
     def _add_label(entity):
         for (ent_text, ent_label, start, end) in named_entities:
@@ -66,4 +69,32 @@ def process(text: str):
         obj_tagged = _add_label(obj)
         tagged_spos.append((subj_tagged, pred, obj_tagged))
 
-    return tagged_spos
\ No newline at end of file
+    return tagged_spos
+
+def process(text: str):
+    # First perform NER on the entire text for better context
+    return _tag_spos(get_ner()(text), get_nlp()(text, disable=DISABLED_PIPES))
+
+def process_batch(texts, batch_size=DOC_BATCH_SIZE):
+    texts = list(texts)
+    if not texts:
+        return []
+    with metrics.timer("ner"):
+        entities = get_ner()(texts, batch_size=batch_size)
+    with metrics.timer("clause_extraction"):
+        docs = get_nlp().pipe(texts, batch_size=batch_size, disable=DISABLED_PIPES)
+        return [_tag_spos(ents, doc) for ents, doc in zip(entities, docs)]
+
+def process_parsed_batch(parsed, batch_size=DOC_BATCH_SIZE):
+    # Shared-parse mode: NER runs on the resolved texts, clauses come from the
+    # coreference Docs with substitutions applied at token level
+    parsed = list(parsed)
+    if not parsed:
+        return []
+    with metrics.timer("ner"):
+        entities = get_ner()([resolved_text for _, resolved_text, _ in parsed], batch_size=batch_size)
+    with metrics.timer("clause_extraction"):
+        return [
+            _tag_spos(ents, doc, substitutions)
+            for ents, (doc, _, substitutions) in zip(entities, parsed)
+        ]
@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from src.config.config import (
+    logger,
+    TOP_K,
+    EMBEDDING_STORE_DIR,
+    ANN_BACKEND,
+    ANN_CANDIDATES,
+    ANN_NLIST,
+    ANN_NPROBE,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+)
+from src.util.embedding_store import (
+    artifact_current,
+    read_artifact_metadata,
+    save_artifact_metadata,
+)
+
+ANN_DIR = "ann"
+# Ranking criterion -> PropertyIndex matrix it searches
+FIELDS = {
+    "label": "label_embs",
+    "description": "description_embs",
+    "alias": "alias_embs",
+    "statement": "statement_embs",
+}
+
+# All backends take unit-normalized float32 rows, score by inner product (the
+# cosine similarity) and return (scores, row ids) sorted by descending score,
+# padded with -1 ids when fewer than k rows are found.
+
+
+class IVFIndex:
+    # Pure-NumPy inverted file: rows are clustered with spherical k-means and a
+    # query only scores the rows of its nprobe closest clusters.
+    extension = "ivf.npz"
+
+    def __init__(self, vectors, centroids, list_ids, list_offsets, nprobe=ANN_NPROBE):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, vectors, nlist=ANN_NLIST, iterations=10, seed=0):
+        n = len(vectors)
+        nlist = min(nlist or max(1, int(np.sqrt(n))), n)
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            counts = np.bincount(assignment, minlength=nlist)
+            # Empty clusters are re-seeded with random rows
+            empty = counts == 0
+            sums[empty] = vectors[rng.choice(n, int(empty.sum()))]
+            centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(1e-12)
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+
+        list_ids = np.argsort(assignment, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=list_offsets[1:])
+        return cls(vectors, centroids.astype(np.float32), list_ids, list_offsets)
+
+    def search(self, queries, k):
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            rows = np.concatenate(
+                [self.list_ids[self.list_offsets[c] : self.list_offsets[c + 1]] for c in lists]
+            )
+            row_scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+            top = np.argsort(-row_scores, kind="stable")[:k]
+            scores[i, : len(top)] = row_scores[top]
+            ids[i, : len(top)] = rows[top]
+        return scores, ids
+
+    def save(self, prefix):
+        # The vectors are not duplicated; they come from the embedding store
+        np.savez(
+            f"{prefix}.{self.extension}",
+            centroids=self.centroids,
+            list_ids=self.list_ids,
+            list_offsets=self.list_offsets,
+        )
+
+    @classmethod
+    def load(cls, prefix, vectors):
+        data = np.load(f"{prefix}.{cls.extension}")
+        return cls(vectors, data["centroids"], data["list_ids"], data["list_offsets"])
+
+
+class FaissHNSWIndex:
+    extension = "faiss"
+
+    def __init__(self, index):
+        import faiss
+
+        self.index = index
+        faiss.downcast_index(index).hnsw.efSearch = HNSW_EF_SEARCH
+
+    @classmethod
+    def build(cls, vectors):
+        import faiss
+
+        index = faiss.IndexHNSWFlat(vectors.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        return cls(index)
+
+    def search(self, queries, k):
+        scores, ids = self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        return scores, ids.astype(np.int64)
+
+    def save(self, prefix):
+        import faiss
+
+        faiss.write_index(self.index, f"{prefix}.{self.extension}")
+
+    @classmethod
+    def load(cls, prefix, vectors):
+        import faiss
+
+        return cls(faiss.read_index(f"{prefix}.{cls.extension}"))
+
+
+class HnswlibIndex:
+    extension = "hnsw"
+
+    def __init__(self, index):
+        self.index = index
+        self.index.set_ef(HNSW_EF_SEARCH)
+
+    @classmethod
+    def build(cls, vectors):
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=len(vectors), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        index.add_items(np.ascontiguousarray(vectors, dtype=np.float32), np.arange(len(vectors)))
+        return cls(index)
+
+    def search(self, queries, k):
+        k = min(k, self.index.get_current_count())
+        ids, distances = self.index.knn_query(np.ascontiguousarray(queries, dtype=np.float32), k=k)
+        # hnswlib reports 1 - inner product
+        return 1.0 - distances, ids.astype(np.int64)
+
+    def save(self, prefix):
+        self.index.save_index(f"{prefix}.{self.extension}")
+
+    @classmethod
+    def load(cls, prefix, vectors):
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.load_index(f"{prefix}.{cls.extension}", max_elements=len(vectors))
+        return cls(index)
+
+
+BACKENDS = {
+    "faiss": FaissHNSWIndex,
+    "hnswlib": HnswlibIndex,
+    "ivf": IVFIndex,
+}
+
+
+def resolve_backend(backend):
+    if backend != "auto":
+        return backend
+    for name, module in (("faiss", "faiss"), ("hnswlib", "hnswlib")):
+        try:
+            __import__(module)
+            return name
+        except ImportError:
+            continue
+    return "ivf"
+
+
+def build_ann(property_index, backend=ANN_BACKEND):
+    backend = resolve_backend(backend)
+    anns = {}
+    for name, field in FIELDS.items():
+        vectors = getattr(property_index, field)
+        if len(vectors) == 0:
+            continue
+        logger.info(f"Building {backend} index over {len(vectors)} {name} embeddings.")
+        anns[name] = BACKENDS[backend].build(np.asarray(vectors, dtype=np.float32))
+    return backend, anns
+
+
+def save_ann(anns, backend, path=EMBEDDING_STORE_DIR):
+    ann_path = os.path.join(path, ANN_DIR)
+    os.makedirs(ann_path, exist_ok=True)
+    for name, ann in anns.items():
+        ann.save(os.path.join(ann_path, name))
+    save_artifact_metadata(path, ANN_DIR, backend, anns)
+    logger.info(f"Saved {backend} indexes for {', '.join(sorted(anns))} to {ann_path}")
+
+
+def ann_current(path=EMBEDDING_STORE_DIR, backend=ANN_BACKEND):
+    return artifact_current(path, ANN_DIR, resolve_backend(backend))
+
+
+def load_ann(property_index, path=EMBEDDING_STORE_DIR):
+    metadata = read_artifact_metadata(path, ANN_DIR)
+    if metadata is None:
+        return {}
+    backend = BACKENDS[metadata["kind"]]
+    anns = {
+        name: backend.load(
+            os.path.join(path, ANN_DIR, name), getattr(property_index, FIELDS[name])
+        )
+        for name in metadata["fields"]
+    }
+    logger.info(f"Loaded {metadata['kind']} indexes for {', '.join(metadata['fields'])}.")
+    return anns
+
+
+def top_k_approx(ann, queries, property_ids, offsets, k, candidates=ANN_CANDIDATES):
+    # Same output as top_k_rows. Alias/statement rows are mapped to their property
+    # segment; a property scores its best retrieved row, as with segment_max.
+    scores, rows = ann.search(queries, max(k, candidates))
+    results = []
+    for row_scores, row_ids in zip(scores, rows):
+        valid = row_ids >= 0
+        row_ids, row_scores = row_ids[valid], row_scores[valid]
+        segments = row_ids if offsets is None else np.searchsorted(offsets, row_ids, side="right") - 1
+        best = {}
+        for segment, score in zip(segments.tolist(), row_scores.tolist()):
+            if segment not in best:
+                best[segment] = score
+                if len(best) == k:
+                    break
+        results.append([(property_ids[segment], float(score)) for segment, score in best.items()])
+    return results
+
+
+def recall_at_k(property_index, clause_embs, pred_embs, k=TOP_K):
+    from src.steps.relationship_extraction.property_ranking import compare_rankings, rank_embeddings
+
+    exact = rank_embeddings(clause_embs, pred_embs, property_index, approximate=False, quantized=False, k=k)
+    approx = rank_embeddings(clause_embs, pred_embs, property_index, approximate=True, quantized=False, k=k)
+    return {name: agreement["recall"] for name, agreement in compare_rankings(exact, approx, k).items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or evaluate the approximate property index.")
+    parser.add_argument("--path", default=EMBEDDING_STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build the index next to the embedding store.")
+    build.add_argument("--backend", choices=["auto", *BACKENDS], default=ANN_BACKEND or "auto")
+
+    recall = commands.add_parser("recall", help="Compare top-K properties with exact search.")
+    recall.add_argument("--texts", help="File with one query text per line (default: sampled embeddings)")
+    recall.add_argument("--samples", type=int, default=500)
+    recall.add_argument("--noise", type=float, default=0.05)
+    recall.add_argument("-k", type=int, default=TOP_K)
+
+    args = parser.parse_args(argv)
+
+    from src.util.embedding_store import load_store
+
+    property_index = load_store(args.path)
+    if args.command == "build":
+        backend, anns = build_ann(property_index, args.backend)
+        save_ann(anns, backend, args.path)
+    elif args.command == "recall":
+        property_index.ann = property_index.ann or load_ann(property_index, args.path)
+        if not property_index.ann:
+            raise SystemExit(f"No approximate index in {args.path}; run the build command first.")
+        from src.steps.relationship_extraction.property_ranking import load_queries
+
+        clause_embs, pred_embs = load_queries(property_index, args.texts, args.samples, args.noise)
+        print(json.dumps({f"recall@{args.k}": recall_at_k(property_index, clause_embs, pred_embs, args.k)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.config.config import (
+    logger,
+    MAX_DEPTH,
+    CLASS_HIERARCHY_FILE,
+    CLOSURE_CACHE_SIZE,
+    BATCH_SIZE,
+)
+from src.util.wikidata_backend import get_backend
+from src.util.data_loader import load_property_data
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not serialized across processes
+    fcntl = None
+
+
+@contextmanager
+def _file_lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(path, mode="a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _chunks(items, n):
+    items = list(items)
+    for i in range(0, len(items), n):
+        yield items[i : i + n]
+
+
+# Dense int32 IDs for class QIDs, shared by every ClassHierarchy and
+# ConstraintIndex of the process, so superclass closures can be intersected
+# with constraint classes directly. Only classes are interned, never entities.
+class ClassIds:
+
+    def __init__(self):
+        self._ids = {}
+        self._qids = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._qids)
+
+    def intern(self, qid):
+        class_id = self._ids.get(qid)
+        if class_id is None:
+            with self._lock:
+                class_id = self._ids.get(qid)
+                if class_id is None:
+                    class_id = len(self._qids)
+                    self._qids.append(qid)
+                    self._ids[qid] = class_id
+        return class_id
+
+    def known(self, qids):
+        # Sorted IDs of the classes already interned; any other class can't be
+        # a constraint class
+        found = [self._ids.get(qid) for qid in qids]
+        return np.unique(np.array([i for i in found if i is not None], dtype=np.int32))
+
+    def to_qids(self, class_ids):
+        return [self._qids[i] for i in class_ids]
+
+
+class_ids = ClassIds()
+
+
+# P279 hierarchy over interned class IDs. Direct superclasses are fetched one
+# frontier at a time and memoized per class (empty results too). The closure
+# of each class (itself and its superclasses up to a depth) is kept as a
+# sorted int32 array in a bounded LRU.
+class ClassHierarchy:
+
+    def __init__(self, path=CLASS_HIERARCHY_FILE, ids=class_ids):
+        self.path = path
+        self.ids = ids
+        self._parents = {}
+        self._closures = OrderedDict()
+        self._dirty = False
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._parents)
+
+    def _ensure_parents(self, class_ids):
+        with self._lock:
+            missing = [i for i in class_ids if i not in self._parents]
+        if not missing:
+            return
+        for chunk in _chunks(missing, BATCH_SIZE):
+            qids = self.ids.to_qids(chunk)
+            edges = get_backend().get_superclasses(qids)
+            with self._lock:
+                for class_id, qid in zip(chunk, qids):
+                    self._parents[class_id] = tuple(
+                        self.ids.intern(q) for q in sorted(edges.get(qid, ()))
+                    )
+                self._dirty = True
+
+    def _expand(self, class_ids, depth):
+        # All classes are expanded together, so each level costs one batched lookup
+        closures = {i: {i} for i in class_ids}
+        frontiers = {i: {i} for i in class_ids}
+        for _ in range(depth):
+            pending = set().union(*frontiers.values())
+            if not pending:
+                break
+            self._ensure_parents(pending)
+            with self._lock:
+                for i, frontier in frontiers.items():
+                    frontiers[i] = {p for c in frontier for p in self._parents[c]} - closures[i]
+                    closures[i].update(frontiers[i])
+        return {i: np.array(sorted(closure), dtype=np.int32) for i, closure in closures.items()}
+
+    def closure(self, qids, depth=MAX_DEPTH):
+        # Sorted IDs of the given classes and their superclasses up to depth levels
+        wanted = {self.ids.intern(qid) for qid in qids}
+        closures, missing = [], []
+        with self._lock:
+            for class_id in wanted:
+                closure = self._closures.get((class_id, depth))
+                if closure is None:
+                    missing.append(class_id)
+                else:
+                    self._closures.move_to_end((class_id, depth))
+                    closures.append(closure)
+        if missing:
+            expanded = self._expand(missing, depth)
+            closures.extend(expanded.values())
+            with self._lock:
+                for class_id, closure in expanded.items():
+                    self._closures[(class_id, depth)] = closure
+                while len(self._closures) > CLOSURE_CACHE_SIZE:
+                    self._closures.popitem(last=False)
+        if not closures:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(closures))
+
+    def ancestors(self, qids, depth=MAX_DEPTH):
+        return self.ids.to_qids(self.closure(qids, depth))
+
+    def warm(self, qids, depth=MAX_DEPTH):
+        logger.info(f"Expanding {len(qids)} classes to depth {depth}.")
+        self.closure(qids, depth)
+
+    def load(self, path):
+        with open(path, mode="r", encoding="utf-8") as file:
+            parents = json.load(file)
+        with self._lock:
+            for qid, superclasses in parents.items():
+                self._parents[self.ids.intern(qid)] = tuple(
+                    self.ids.intern(q) for q in superclasses
+                )
+        logger.info(f"Loaded superclasses of {len(parents)} classes from {path}.")
+
+    def save(self, path=None):
+        path = path or self.path
+        with self._lock:
+            if not self._dirty and path == self.path:
+                return
+            parents = {
+                qid: self.ids.to_qids(superclasses)
+                for qid, superclasses in zip(
+                    self.ids.to_qids(self._parents), self._parents.values()
+                )
+            }
+            self._dirty = False
+        # Several processes (e.g. pool workers) save to the same file: each merges
+        # with what is already on disk, under a lock, and writes its own temp file
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with _file_lock(f"{path}.lock"):
+            if os.path.exists(path):
+                with open(path, mode="r", encoding="utf-8") as file:
+                    for qid, superclasses in json.load(file).items():
+                        parents.setdefault(qid, superclasses)
+            with tempfile.NamedTemporaryFile(
+                mode="w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False
+            ) as file:
+                json.dump(parents, file)
+            os.replace(file.name, path)
+        logger.info(f"Saved superclasses of {len(parents)} classes to {path}.")
+
+
+def constraint_classes(constraints):
+    classes = set()
+    for constraint in constraints.values():
+        classes.update(constraint.get("subjectConstraints", []))
+        classes.update(constraint.get("valueConstraints", []))
+    return classes
+
+
+# Superclasses fetched lazily at run time are kept for the next run by calling
+# save() at the end of a run (and of each worker shard)
+class_hierarchy = ClassHierarchy()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Precompute superclass closures of every constraint class."
+    )
+    parser.add_argument("--depth", type=int, default=MAX_DEPTH)
+    parser.add_argument("--output", default=CLASS_HIERARCHY_FILE)
+    args = parser.parse_args(argv)
+
+    _, constraints = load_property_data()
+    classes = sorted(constraint_classes(constraints))
+    logger.info(f"Precomputing superclasses for {len(classes)} constraint classes.")
+    class_hierarchy.warm(classes, args.depth)
+    class_hierarchy.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
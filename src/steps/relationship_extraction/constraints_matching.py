@@ -1,109 +1,113 @@
-from src.config.config import logger, WIKIDATA_SPARQL_URL
-from src.util.sparql_service import run_sparql
-from src.config.query import build_class_query, build_superclass_query
+from collections import defaultdict
 
+import numpy as np
 
-superclass_cache = {}
-
-
-def get_deeper_superclasses(qids):
-    if not qids:
-        return set()
-    subclass_query = build_superclass_query(qids)
-    data = run_sparql(WIKIDATA_SPARQL_URL, subclass_query, rotating_user_agent=False)
-
-    new_superclasses = set()
-    for item in data["results"]["bindings"]:
-        if "superclass" in item:
-            new_superclass = item["superclass"]["value"].split("/")[-1]
-            if new_superclass not in qids:
-                new_superclasses.add(new_superclass)
-
-    return new_superclasses
+from src.config.config import logger
+from src.util.metrics import timed
+from src.util.wikidata_backend import get_backend
+from src.steps.relationship_extraction.class_hierarchy import class_hierarchy, class_ids
 
 
 def get_classes(qid):
-    logger.info(f"Fetching classes for QID: {qid}")
-
-    classes = set()
+    logger.debug("Fetching classes for QID: %s", qid)
 
-    sparql_query = build_class_query(qid)
+    return list(set(get_backend().get_classes(qid)))
 
-    data = run_sparql(WIKIDATA_SPARQL_URL, sparql_query, rotating_user_agent=False)
 
-    for item in data["results"]["bindings"]:
-        if "class" in item:
-            classes.add(item["class"]["value"].split("/")[-1])
-    return list(classes)
+@timed("superclass_expansion")
+def get_superclasses(classes, depth):
+    logger.debug("Fetching superclasses for classes: %s (depth=%s)", classes, depth)
 
+    closure = class_hierarchy.closure(classes, depth)
 
-def get_superclasses(qid, depth):
-    logger.info(f"Fetching superclasses for QID: {qid} (depth={depth})")
+    logger.debug(
+        "Classes %s - Superclasses (%s levels): %s found", classes, depth, len(closure)
+    )
+    return closure
+
+
+# Inverted index over the parsed property constraints. Constraint classes are
+# interned into the class hierarchy's ID space and kept as sorted int32 arrays,
+# each aligned with the properties allowing that class as domain (subject) or
+# range (value), so a lookup is one intersection with a class closure.
+class ConstraintIndex:
+
+    def __init__(self, property_constraints, ids=class_ids):
+        self.ids = ids
+        self.order = {prop: i for i, prop in enumerate(property_constraints)}
+        domain = defaultdict(set)
+        range_ = defaultdict(set)
+        for prop, constraints in property_constraints.items():
+            for cls in constraints.get("subjectConstraints", []):
+                domain[ids.intern(cls.split("/")[-1])].add(prop)
+            for cls in constraints.get("valueConstraints", []):
+                range_[ids.intern(cls.split("/")[-1])].add(prop)
+        self.domain_classes, self.domain_props = self._freeze(domain)
+        self.range_classes, self.range_props = self._freeze(range_)
+        logger.info(
+            f"Indexed constraints of {len(self.order)} properties over "
+            f"{len(self.domain_classes)} domain and {len(self.range_classes)} range classes."
+        )
 
-    superclasses = set()
+    @staticmethod
+    def _freeze(index):
+        classes = np.array(sorted(index), dtype=np.int32)
+        return classes, [frozenset(index[i]) for i in classes]
 
-    # Direct expansion
-    superclasses.update(get_deeper_superclasses([qid]))
-    current_superclasses = set(superclasses)
-    # Deeper expansions
-    i = 1
-    while i < depth:
-        new_superclasses = get_deeper_superclasses(current_superclasses)
-        # Remove already seen superclasses to avoid infinite loops due to cycles
-        new_superclasses -= superclasses
-        superclasses.update(new_superclasses)
-        current_superclasses = new_superclasses
-        i += 1
+    @staticmethod
+    def _lookup(classes, props, class_ids):
+        _, hits, _ = np.intersect1d(classes, class_ids, assume_unique=True, return_indices=True)
+        return set().union(*(props[i] for i in hits))
 
-    logger.info(
-        f"QID {qid} - Superclasses ({depth} levels): {len(superclasses)} found"
-    )
-    return list(superclasses)
+    def match_ids(self, subject_ids, object_ids):
+        # Both arguments are sorted arrays of unique class IDs
+        domain_props = self._lookup(self.domain_classes, self.domain_props, subject_ids)
+        if not domain_props:
+            return []
+        matched = domain_props & self._lookup(self.range_classes, self.range_props, object_ids)
+        return sorted(matched, key=self.order.__getitem__)
 
+    def match(self, subject_classes, object_classes):
+        return self.match_ids(self.ids.known(subject_classes), self.ids.known(object_classes))
 
-def match_with_constraints(property_constraints, subject_classes, object_classes):
-    matched_properties = []
-    for prop, constraints in property_constraints.items():
-        domain_classes = [
-            cls.split("/")[-1] for cls in constraints.get("subjectConstraints", [])
-        ]
-        range_classes = [
-            cls.split("/")[-1] for cls in constraints.get("valueConstraints", [])
-        ]
 
-        domain_match = any(cls in subject_classes for cls in domain_classes)
-        range_match = any(cls in object_classes for cls in range_classes)
-
-        if domain_match and range_match:
-            matched_properties.append(prop)
-    return matched_properties
+def match_with_constraints(constraint_index, subject_classes, object_classes):
+    return constraint_index.match(subject_classes, object_classes)
 
 
 def match_entities_to_properties(
-    subject_qid, object_qid, property_constraints, max_depth
+    subject_qid,
+    object_qid,
+    constraint_index,
+    max_depth,
+    subject_classes=None,
+    object_classes=None,
 ):
 
-    subject_classes = [cls.split("/")[-1] for cls in get_classes(subject_qid)]
-    object_classes = [cls.split("/")[-1] for cls in get_classes(object_qid)]
+    if subject_classes is None:
+        subject_classes = get_classes(subject_qid)
+    if object_classes is None:
+        object_classes = get_classes(object_qid)
+    subject_classes = [cls.split("/")[-1] for cls in subject_classes]
+    object_classes = [cls.split("/")[-1] for cls in object_classes]
 
     matched_properties = match_with_constraints(
-        property_constraints, subject_classes, object_classes
+        constraint_index, subject_classes, object_classes
     )
 
     if not matched_properties:
-        logger.warning(
-            f"No matching properties found for direct Subject: {subject_classes} Object: {object_classes} classes"
+        logger.debug(
+            "No matching properties found for direct Subject: %s Object: %s classes",
+            subject_classes,
+            object_classes,
         )
-        logger.info("Expanding with superclasses...")
-        subject_superclasses = [
-            cls.split("/")[-1] for cls in get_superclasses(subject_qid, max_depth)
-        ]
-        object_superclasses = [
-            cls.split("/")[-1] for cls in get_superclasses(object_qid, max_depth)
-        ]
-        matched_properties = match_with_constraints(
-            property_constraints, subject_superclasses, object_superclasses
+        logger.debug("Expanding with superclasses...")
+        # Closures of the entities' P31 classes, which include the classes
+        # themselves: a direct class can match on one side, a superclass on the other
+        matched_properties = constraint_index.match_ids(
+            get_superclasses(subject_classes, max_depth),
+            get_superclasses(object_classes, max_depth),
         )
 
-    logger.info(f"Constraint matched properties: {matched_properties}")
+    logger.debug("Constraint matched properties: %s", matched_properties)
     return matched_properties
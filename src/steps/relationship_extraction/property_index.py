@@ -0,0 +1,126 @@
+import numpy as np
+
+from src.config.config import logger
+
+
+def _stack(embs):
+    return np.ascontiguousarray(np.vstack(embs), dtype=np.float32)
+
+
+def _flatten(property_ids, ragged_embs, dim):
+    properties, offsets, blocks = [], [], []
+    total = 0
+    for prop, embs in zip(property_ids, ragged_embs):
+        if embs is None or len(embs) == 0:
+            continue
+        embs = np.atleast_2d(np.asarray(embs, dtype=np.float32))
+        properties.append(prop)
+        offsets.append(total)
+        blocks.append(embs)
+        total += len(embs)
+
+    if not blocks:
+        return np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=np.int64), []
+    return _stack(blocks), np.asarray(offsets, dtype=np.int64), properties
+
+
+# Rows widened to float32 per scoring block, so a half-precision or int8 matrix
+# (e.g. a memory-mapped float16 store) is never copied whole
+BLOCK_ROWS = 4096
+
+
+def matrix_scores(queries, matrix):
+    # queries @ matrix.T in float32
+    if matrix.dtype == np.float32:
+        return queries @ matrix.T
+    scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = np.asarray(matrix[start : start + BLOCK_ROWS], dtype=np.float32)
+        scores[:, start : start + len(block)] = queries @ block.T
+    return scores
+
+
+def segment_max(sims, offsets):
+    # Max over each contiguous segment (last axis) of the flattened alias/statement rows
+    if len(offsets) == 0:
+        return sims[..., :0]
+    return np.maximum.reduceat(sims, offsets, axis=-1)
+
+
+def top_k_rows(property_ids, scores, k):
+    n, m = scores.shape
+    k = min(k, m)
+    if k == 0:
+        return [[] for _ in range(n)]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [
+        [(property_ids[i], float(score)) for i, score in zip(row, row_scores)]
+        for row, row_scores in zip(top, top_scores)
+    ]
+
+
+# Labels and descriptions hold one row per property. Aliases and statements are
+# ragged, so they are flattened and each property's segment is addressed by its
+# start offset.
+class PropertyIndex:
+
+    def __init__(
+        self,
+        properties,
+        label_embs,
+        description_embs,
+        alias_embs,
+        alias_offsets,
+        alias_properties,
+        statement_embs,
+        statement_offsets,
+        statement_properties,
+    ):
+        self.properties = list(properties)
+        self.label_embs = label_embs
+        self.description_embs = description_embs
+        self.alias_embs = alias_embs
+        self.alias_offsets = alias_offsets
+        self.alias_properties = list(alias_properties)
+        self.statement_embs = statement_embs
+        self.statement_offsets = statement_offsets
+        self.statement_properties = list(statement_properties)
+        # Optional approximate indexes and quantized matrices by ranking criterion
+        # (see ann_index and quantized_index)
+        self.ann = {}
+        self.quantized = {}
+
+    @classmethod
+    def from_dataframes(cls, properties_df, constraints_df):
+        logger.info("Building property embedding index.")
+
+        label_embs = _stack(properties_df["label_emb"].to_numpy())
+        description_embs = _stack(properties_df["description_emb"].to_numpy())
+        dim = label_embs.shape[1]
+
+        alias_embs, alias_offsets, alias_properties = _flatten(
+            properties_df["property"], properties_df["aliases_emb"], dim
+        )
+        statement_embs, statement_offsets, statement_properties = _flatten(
+            constraints_df["property"], constraints_df["statements_emb"], dim
+        )
+
+        logger.info(
+            f"Indexed {len(label_embs)} properties, {len(alias_embs)} aliases "
+            f"and {len(statement_embs)} statements."
+        )
+        return cls(
+            properties_df["property"].tolist(),
+            label_embs,
+            description_embs,
+            alias_embs,
+            alias_offsets,
+            alias_properties,
+            statement_embs,
+            statement_offsets,
+            statement_properties,
+        )
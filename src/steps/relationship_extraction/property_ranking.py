@@ -1,70 +1,112 @@
 import numpy as np
-import pandas as pd
-
 
 from src.config.config import (
     logger,
-    BERT_MODEL,
     TOP_K,
 )
-from sentence_transformers import SentenceTransformer
-
-
-bert_model = SentenceTransformer(BERT_MODEL)
-
-
-def rank_properties_with_bert(clause, pred_text, properties_df, constraints_df):
-    logger.info("Ranking candidate properties using BERT.")
-
-    label_embs = np.vstack(properties_df["label_emb"].to_numpy())
-
-    description_embs = np.vstack(properties_df["description_emb"].to_numpy())
-
-    clause_emb = bert_model.encode(clause, convert_to_numpy=True)
-
-    pred_emb = bert_model.encode(pred_text, convert_to_numpy=True)
-
-    sims_by_label = label_embs @ pred_emb
-    sims_by_description = description_embs @ clause_emb
-
-    sorted_idx_by_label = np.argsort(-sims_by_label)
-    ranked_by_label = [
-        (properties_df.iloc[i]["property"], float(sims_by_label[i]))
-        for i in sorted_idx_by_label
-    ]
-
-    sorted_idx_by_description = np.argsort(-sims_by_description)
-    ranked_by_description = [
-        (properties_df.iloc[i]["property"], float(sims_by_description[i]))
-        for i in sorted_idx_by_description
-    ]
-
-    ranked_by_statements = []
-
-    for _, row in constraints_df.iterrows():
-        embs = row["statements_emb"]
-
-        if embs is None or len(embs) == 0:
+from src.steps.relationship_extraction.ann_index import FIELDS, top_k_approx
+from src.steps.relationship_extraction.property_index import matrix_scores, segment_max, top_k_rows
+from src.steps.relationship_extraction.quantized_index import rerank_top_k
+from src.util.embedding_cache import encode
+
+
+def encode_clauses(clauses, pred_texts):
+    if not clauses:
+        return [], []
+    # Predicate lemmas repeat heavily, so both go through the shared cache in one call
+    embs = encode(list(clauses) + list(pred_texts))
+    return embs[: len(clauses)], embs[len(clauses) :]
+
+
+def rank_embeddings(clause_embs, pred_embs, property_index, approximate=None, quantized=None, k=TOP_K):
+    clause_embs = np.asarray(clause_embs, dtype=np.float32)
+    pred_embs = np.asarray(pred_embs, dtype=np.float32)
+    if approximate is None:
+        approximate = bool(property_index.ann)
+    if quantized is None:
+        quantized = bool(property_index.quantized)
+
+    rankings = []
+    for name, queries, property_ids, offsets in (
+        ("label", pred_embs, property_index.properties, None),
+        ("description", clause_embs, property_index.properties, None),
+        ("alias", pred_embs, property_index.alias_properties, property_index.alias_offsets),
+        ("statement", clause_embs, property_index.statement_properties, property_index.statement_offsets),
+    ):
+        ann = property_index.ann.get(name) if approximate else None
+        if ann is not None:
+            rankings.append(top_k_approx(ann, queries, property_ids, offsets, k))
             continue
-        sims = embs @ clause_emb
-        max_sim = float(np.max(sims))
-        ranked_by_statements.append((row["property"], max_sim))
-    ranked_by_statements.sort(key=lambda x: x[1], reverse=True)
-
-    ranked_by_aliases = []
-    for _, row in properties_df.iterrows():
-        embs = row["aliases_emb"]
-
-        if embs is None or len(embs) == 0:
+        matrix = getattr(property_index, FIELDS[name])
+        codes = property_index.quantized.get(name) if quantized else None
+        if codes is not None:
+            # Coarse scores on the quantized matrix, exact scores for the best candidates
+            coarse = codes.scores(queries)
+            if offsets is not None:
+                coarse = segment_max(coarse, offsets)
+            rankings.append(rerank_top_k(queries, coarse, matrix, offsets, property_ids, k))
             continue
-        sims = embs @ pred_emb
-        max_sim = float(np.max(sims))
-        ranked_by_aliases.append((row["property"], max_sim))
-    ranked_by_aliases.sort(key=lambda x: x[1], reverse=True)
-
-    return (
-        ranked_by_label[:TOP_K],
-        ranked_by_description[:TOP_K],
-        ranked_by_aliases[:TOP_K],
-        ranked_by_statements[:TOP_K],
-    )
+        # (N x P) similarity matrix, reduced to one score per property for aliases and statements
+        sims = matrix_scores(queries, matrix)
+        if offsets is not None:
+            sims = segment_max(sims, offsets)
+        rankings.append(top_k_rows(property_ids, sims, k))
+
+    return list(zip(*rankings))
+
+
+def rank_properties_batch(clauses, pred_texts, property_index):
+    if not clauses:
+        return []
+    logger.debug("Ranking candidate properties using BERT for %s clauses.", len(clauses))
+
+    clause_embs, pred_embs = encode_clauses(clauses, pred_texts)
+    return rank_embeddings(clause_embs, pred_embs, property_index)
+
+
+def rank_properties_with_bert(clause, pred_text, property_index):
+    return rank_properties_batch([clause], [pred_text], property_index)[0]
+
+
+def compare_rankings(reference, rankings, k=TOP_K):
+    # Per criterion: share of the reference top-K found in the top-K, and how
+    # often the top-1 property is the same
+    agreement = {}
+    for i, name in enumerate(FIELDS):
+        hits = total = same_top = rows = 0
+        for reference_row, row in zip(reference, rankings):
+            expected = [prop for prop, _ in reference_row[i][:k]]
+            found = [prop for prop, _ in row[i][:k]]
+            if not expected:
+                continue
+            hits += len(set(expected) & set(found))
+            total += len(expected)
+            same_top += bool(found) and found[0] == expected[0]
+            rows += 1
+        agreement[name] = {
+            "recall": round(hits / total, 4) if total else None,
+            "top1": round(same_top / rows, 4) if rows else None,
+        }
+    return agreement
+
+
+def sample_queries(property_index, n, noise, seed=0):
+    # Without query texts, perturbed property embeddings stand in for encoded clauses
+    rng = np.random.default_rng(seed)
+
+    def sample(matrix):
+        rows = np.asarray(matrix[np.sort(rng.choice(len(matrix), n))], dtype=np.float32)
+        rows = rows + rng.normal(0, noise, rows.shape).astype(np.float32)
+        return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+    return sample(property_index.description_embs), sample(property_index.label_embs)
+
+
+def load_queries(property_index, texts_file=None, samples=500, noise=0.05):
+    if texts_file is None:
+        return sample_queries(property_index, samples, noise)
+    with open(texts_file, encoding="utf-8") as file:
+        texts = [line.strip() for line in file if line.strip()]
+    embs = encode(texts)
+    embs = embs / np.linalg.norm(embs, axis=1, keepdims=True)
+    return embs, embs
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from src.config.config import (
+    logger,
+    TOP_K,
+    EMBEDDING_STORE_DIR,
+    EMBEDDING_QUANTIZATION,
+    RERANK_CANDIDATES,
+)
+from src.steps.relationship_extraction.property_index import matrix_scores
+from src.util.embedding_store import (
+    artifact_current,
+    read_artifact_metadata,
+    save_artifact_metadata,
+)
+
+QUANTIZED_DIR = "quantized"
+KINDS = ("int8", "float16")
+
+
+# Scalar-quantized copy of an embedding matrix. int8 rows keep a float32 scale
+# each (symmetric, max |x| -> 127); float16 rows need none.
+class QuantizedMatrix:
+
+    def __init__(self, codes, scales=None):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def quantize(cls, matrix, kind):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if kind == "float16":
+            return cls(matrix.astype(np.float16))
+        if kind != "int8":
+            raise ValueError(f"Unsupported quantization: {kind}")
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return cls(codes, scales.astype(np.float32))
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def scores(self, queries):
+        # Approximate queries @ matrix.T
+        scores = matrix_scores(np.asarray(queries, dtype=np.float32), self.codes)
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+
+def _segment_rows(offsets, total, segments):
+    # Row ids and local segment starts of the given alias/statement segments
+    ends = np.append(offsets[1:], total)
+    starts, lengths = offsets[segments], ends[segments] - offsets[segments]
+    rows = np.concatenate([np.arange(s, s + n) for s, n in zip(starts, lengths)])
+    local_offsets = np.zeros(len(segments), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=local_offsets[1:])
+    return rows, local_offsets
+
+
+def rerank_top_k(queries, coarse, matrix, offsets, property_ids, k, candidates=RERANK_CANDIDATES):
+    # Takes the best `candidates` properties by coarse score and ranks them by
+    # their exact float32 score; same output as top_k_rows
+    n, m = coarse.shape
+    k = min(k, m)
+    if k == 0:
+        return [[] for _ in range(n)]
+    candidates = min(max(candidates, k), m)
+    top = np.argpartition(-coarse, candidates - 1, axis=1)[:, :candidates]
+
+    results = []
+    for query, segments in zip(np.asarray(queries, dtype=np.float32), top):
+        # Sorted ids read the memory-mapped matrix front to back
+        segments = np.sort(segments)
+        if offsets is None:
+            exact = np.asarray(matrix[segments], dtype=np.float32) @ query
+        else:
+            rows, local_offsets = _segment_rows(offsets, len(matrix), segments)
+            exact = np.maximum.reduceat(
+                np.asarray(matrix[rows], dtype=np.float32) @ query, local_offsets
+            )
+        order = np.argsort(-exact, kind="stable")[:k]
+        results.append([(property_ids[segments[i]], float(exact[i])) for i in order])
+    return results
+
+
+def quantize_index(property_index, kind=EMBEDDING_QUANTIZATION):
+    from src.steps.relationship_extraction.ann_index import FIELDS
+
+    return {
+        name: QuantizedMatrix.quantize(getattr(property_index, field), kind)
+        for name, field in FIELDS.items()
+        if len(getattr(property_index, field))
+    }
+
+
+def save_quantized(quantized, kind, path=EMBEDDING_STORE_DIR):
+    quantized_path = os.path.join(path, QUANTIZED_DIR)
+    os.makedirs(quantized_path, exist_ok=True)
+    for name, matrix in quantized.items():
+        np.save(os.path.join(quantized_path, f"{name}.codes.npy"), matrix.codes)
+        if matrix.scales is not None:
+            np.save(os.path.join(quantized_path, f"{name}.scales.npy"), matrix.scales)
+    save_artifact_metadata(path, QUANTIZED_DIR, kind, quantized)
+    logger.info(f"Saved {kind} matrices for {', '.join(sorted(quantized))} to {quantized_path}")
+
+
+def quantized_current(path=EMBEDDING_STORE_DIR, kind=EMBEDDING_QUANTIZATION):
+    return artifact_current(path, QUANTIZED_DIR, kind)
+
+
+def load_quantized(path=EMBEDDING_STORE_DIR):
+    metadata = read_artifact_metadata(path, QUANTIZED_DIR)
+    if metadata is None:
+        return {}
+    quantized_path = os.path.join(path, QUANTIZED_DIR)
+    quantized = {}
+    for name in metadata["fields"]:
+        # Loaded into memory: coarse scoring reads every row on each call
+        codes = np.load(os.path.join(quantized_path, f"{name}.codes.npy"))
+        scales_path = os.path.join(quantized_path, f"{name}.scales.npy")
+        scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        quantized[name] = QuantizedMatrix(codes, scales)
+    logger.info(f"Loaded {metadata['kind']} matrices for {', '.join(metadata['fields'])}.")
+    return quantized
+
+
+def report(property_index, quantized, clause_embs, pred_embs, k=TOP_K):
+    from src.steps.relationship_extraction.ann_index import FIELDS
+    from src.steps.relationship_extraction.property_ranking import compare_rankings, rank_embeddings
+
+    property_index.quantized = quantized
+    timings = {}
+    rankings = {}
+    for mode in ("exact", "quantized"):
+        start = time.perf_counter()
+        rankings[mode] = rank_embeddings(
+            clause_embs, pred_embs, property_index,
+            approximate=False, quantized=mode == "quantized", k=k,
+        )
+        timings[mode] = round((time.perf_counter() - start) * 1000 / max(len(clause_embs), 1), 3)
+
+    float32_bytes = {
+        name: int(np.prod(getattr(property_index, FIELDS[name]).shape)) * 4 for name in quantized
+    }
+    quantized_bytes = {name: matrix.nbytes for name, matrix in quantized.items()}
+    return {
+        "float32_mb": round(sum(float32_bytes.values()) / 2**20, 2),
+        "quantized_mb": round(sum(quantized_bytes.values()) / 2**20, 2),
+        "memory_ratio": round(sum(float32_bytes.values()) / max(sum(quantized_bytes.values()), 1), 2),
+        "ms_per_query": timings,
+        "agreement": compare_rankings(rankings["exact"], rankings["quantized"], k),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or evaluate quantized property embeddings.")
+    parser.add_argument("--path", default=EMBEDDING_STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Quantize the embedding store.")
+    build.add_argument("--kind", choices=KINDS, default=EMBEDDING_QUANTIZATION or "int8")
+
+    evaluate = commands.add_parser(
+        "report", help="Report memory savings and rank agreement with the exact path."
+    )
+    evaluate.add_argument("--kind", choices=KINDS, help="Quantize on the fly instead of loading the stored matrices")
+    evaluate.add_argument("--texts", help="File with one query text per line (default: sampled embeddings)")
+    evaluate.add_argument("--samples", type=int, default=500)
+    evaluate.add_argument("--noise", type=float, default=0.05)
+    evaluate.add_argument("-k", type=int, default=TOP_K)
+
+    args = parser.parse_args(argv)
+
+    from src.util.embedding_store import load_store
+
+    property_index = load_store(args.path)
+    if args.command == "build":
+        save_quantized(quantize_index(property_index, args.kind), args.kind, args.path)
+    elif args.command == "report":
+        from src.steps.relationship_extraction.property_ranking import load_queries
+
+        quantized = quantize_index(property_index, args.kind) if args.kind else load_quantized(args.path)
+        if not quantized:
+            raise SystemExit(f"No quantized matrices in {args.path}; run the build command or pass --kind.")
+        clause_embs, pred_embs = load_queries(property_index, args.texts, args.samples, args.noise)
+        print(json.dumps(report(property_index, quantized, clause_embs, pred_embs, args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
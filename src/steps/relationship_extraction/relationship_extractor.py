@@ -3,37 +3,67 @@ from src.util.data_loader import load_property_data
 from src.steps.relationship_extraction.constraints_matching import (
     match_entities_to_properties,
 )
-from src.steps.relationship_extraction.property_ranking import rank_properties_with_bert
+from src.steps.relationship_extraction.property_ranking import (
+    rank_properties_batch,
+    rank_properties_with_bert,
+)
+
+
+def build_clause(subj_text, pred_text, obj_text):
+    return f"{subj_text} {pred_text} {obj_text}"
+
+
+def rank_relationships(spos, property_index):
+    clauses = [build_clause(subj, pred, obj) for subj, pred, obj in spos]
+    return rank_properties_batch(clauses, [pred for _, pred, _ in spos], property_index)
 
 
-def extract_relationship(subj_text, subject_qid, obj_text, object_qid, pred_text, properties, constraints):
+def extract_relationship(
+    subj_text,
+    subject_qid,
+    obj_text,
+    object_qid,
+    pred_text,
+    property_index,
+    constraint_index,
+    rankings=None,
+    subject_classes=None,
+    object_classes=None,
+):
 
-    clause = f"{subj_text} {pred_text} {obj_text}"
+    if rankings is None:
+        clause = build_clause(subj_text, pred_text, obj_text)
+        rankings = rank_properties_with_bert(clause, pred_text, property_index)
     (
         bert_ranked_by_label,
         bert_ranked_by_description,
         bert_ranked_by_aliases,
         bert_ranked_by_statements,
-    ) = rank_properties_with_bert(clause, pred_text, properties, constraints)
+    ) = rankings
 
-    logger.info(
-        f"Top {TOP_K} BERT-ranked properties (by label): {bert_ranked_by_label}"
+    logger.debug(
+        "Top %s BERT-ranked properties (by label): %s", TOP_K, bert_ranked_by_label
     )
 
-    logger.info(
-        f"Top {TOP_K} BERT-ranked properties (by description): {bert_ranked_by_description}"
+    logger.debug(
+        "Top %s BERT-ranked properties (by description): %s", TOP_K, bert_ranked_by_description
     )
 
-    logger.info(
-        f"Top {TOP_K} BERT-ranked properties (by statements): {bert_ranked_by_statements}"
+    logger.debug(
+        "Top %s BERT-ranked properties (by statements): %s", TOP_K, bert_ranked_by_statements
     )
 
-    logger.info(
-        f"Top {TOP_K} BERT-ranked properties (by aliases): {bert_ranked_by_aliases}"
+    logger.debug(
+        "Top %s BERT-ranked properties (by aliases): %s", TOP_K, bert_ranked_by_aliases
     )
 
     constraint_matched_properties = match_entities_to_properties(
-        subject_qid, object_qid, constraints, MAX_DEPTH
+        subject_qid,
+        object_qid,
+        constraint_index,
+        MAX_DEPTH,
+        subject_classes,
+        object_classes,
     )
 
     candidates = (
@@ -48,7 +78,7 @@ def extract_relationship(subj_text, subject_qid, obj_text, object_qid, pred_text
 
     best_bert_property = max(candidates, key=lambda x: x[1])[0]
 
-    logger.info(f"Final selected property (BERT): {best_bert_property}")
-    logger.info(f"Domain/range matching properties: {constraint_matched_properties}")
+    logger.debug("Final selected property (BERT): %s", best_bert_property)
+    logger.debug("Domain/range matching properties: %s", constraint_matched_properties)
 
     return best_bert_property, constraint_matched_properties
@@ -0,0 +1,53 @@
+from collections import deque
+
+from src.config.config import (
+    STREAM_BLOCK_CHARS,
+    STREAM_OVERLAP_SENTENCES,
+    STREAM_WINDOW_SENTENCES,
+)
+from src.util.registry import get_sentencizer
+
+
+def iter_chunks(text, block_chars=STREAM_BLOCK_CHARS):
+    # A string is cut into blocks; any other iterable (e.g. an open file) is used as is
+    if isinstance(text, str):
+        return (text[i : i + block_chars] for i in range(0, len(text), block_chars))
+    return text
+
+
+def iter_sentences(text, block_chars=STREAM_BLOCK_CHARS):
+    # Splits block by block; the last sentence of each block may be cut off, so
+    # it is carried over and split again together with the next block
+    nlp = get_sentencizer()
+    tail = ""
+    for chunk in iter_chunks(text, block_chars):
+        tail += chunk
+        if len(tail) < block_chars:
+            continue
+        sentences = list(nlp(tail).sents)
+        # A single sentence longer than two blocks is not carried any further
+        if len(sentences) == 1 and len(tail) >= 2 * block_chars:
+            sentences, tail = [tail], ""
+        else:
+            last = sentences.pop()
+            sentences, tail = [sent.text for sent in sentences], tail[last.start_char :]
+        yield from (sentence.strip() for sentence in sentences if sentence.strip())
+    if tail.strip():
+        yield from (sent.text.strip() for sent in nlp(tail).sents if sent.text.strip())
+
+
+def iter_windows(sentences, size=STREAM_WINDOW_SENTENCES, overlap=STREAM_OVERLAP_SENTENCES):
+    # (context, new) pairs: every sentence is new in exactly one window, and the
+    # last `overlap` sentences before it are passed along as context
+    if not 0 <= overlap < size:
+        raise ValueError(f"Window overlap must be in [0, {size}), got {overlap}")
+    context = deque(maxlen=overlap)
+    new = []
+    for sentence in sentences:
+        new.append(sentence)
+        if len(new) == size - overlap:
+            yield list(context), new
+            context.extend(new)
+            new = []
+    if new:
+        yield list(context), new
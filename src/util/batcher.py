@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.config.config import logger, MICRO_BATCH_WINDOW, HTTP_CONCURRENCY
+from src.util.metrics import metrics
+
+
+# Gathers single-key lookups from many threads over a short window and answers
+# them with one fn(keys) -> {key: value} call of up to max_batch keys. Keys that
+# are missing from the result resolve to `default`.
+class MicroBatcher:
+
+    def __init__(self, fn, max_batch, window=MICRO_BATCH_WINDOW, default=None, name="batcher"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.window = window
+        self.default = default
+        self.name = name
+        self._queue = []
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=HTTP_CONCURRENCY, thread_name_prefix=name
+        )
+
+    def submit(self, key):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            future = self._pending.get(key)
+            if future is None:
+                future = Future()
+                self._pending[key] = future
+                self._queue.append(key)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+            return future
+
+    def get(self, key):
+        return self.submit(key).result()
+
+    def get_many(self, keys):
+        futures = {key: self.submit(key) for key in dict.fromkeys(keys)}
+        return {key: future.result() for key, future in futures.items()}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                keys = self._queue[: self.max_batch]
+                del self._queue[: self.max_batch]
+                futures = [self._pending.pop(key) for key in keys]
+            self._executor.submit(self._dispatch, keys, futures)
+
+    def _dispatch(self, keys, futures):
+        logger.debug("%s: dispatching batch of %s", self.name, len(keys))
+        metrics.observe("micro_batch_size", len(keys))
+        try:
+            results = self.fn(keys)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for key, future in zip(keys, futures):
+            future.set_result(results.get(key, self.default))
+
+    def close(self):
+        # Keys already submitted are still answered before the threads exit
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._executor.shutdown(wait=True)
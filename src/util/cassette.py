@@ -0,0 +1,234 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import tarfile
+import threading
+
+from src.config.config import logger, HTTP_CASSETTE, HTTP_CASSETTE_DIR, HTTP_CASSETTE_STRICT
+from src.util.metrics import metrics
+
+MODES = ("record", "replay")
+KEYS_DIR = "keys"
+BLOBS_DIR = "blobs"
+OBJECT_NAME = re.compile(r"^(keys/[0-9a-f]{2}/[0-9a-f]{64}\.json|blobs/[0-9a-f]{2}/[0-9a-f]{64}\.json\.gz)$")
+VALUES_PATTERN = re.compile(r"VALUES \?(\w+) \{([^}]*)\}")
+MISS = object()
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def _digest(key):
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _split(url, params):
+    # Requests whose batch composition depends on timing are stored per ID, so a
+    # replay answers any grouping of the same IDs:
+    #   wbgetentities ids=Q1|Q2             -> one entity per ID
+    #   SPARQL "VALUES ?var { wd:Q1 wd:Q2 }" -> the bindings of each ID
+    # Returns (kind, [(key, qid)], var), or None for requests stored whole
+    if not isinstance(params, dict):
+        return None
+    if params.get("action") == "wbgetentities" and "ids" in params:
+        rest = {name: value for name, value in params.items() if name != "ids"}
+        qids = params["ids"].split("|")
+        return "entities", [(["ids", url, rest, qid], qid) for qid in qids], None
+    match = VALUES_PATTERN.search(params.get("query") or "")
+    if match:
+        query = params["query"]
+        template = " ".join((query[: match.start(2)] + " {ids} " + query[match.end(2) :]).split())
+        rest = {name: value for name, value in params.items() if name != "query"}
+        qids = [value.split(":")[-1] for value in match.group(2).split()]
+        return "values", [(["values", url, template, rest, qid], qid) for qid in qids], match.group(1)
+    return None
+
+
+# Record/replay store of HTTP responses. A request key (or the per-ID key of a
+# batched request) points to a blob named by the SHA-256 of its content, so
+# identical bodies, such as the many empty per-ID results, are stored once.
+# Recordings from several runs or workers merge by copying files.
+class Cassette:
+
+    def __init__(self, path=HTTP_CASSETTE_DIR, mode="replay", strict=True):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode} (expected one of {MODES})")
+        self.path = path
+        self.mode = mode
+        self.strict = strict
+        self._lock = threading.Lock()
+
+    def _file(self, directory, digest, suffix):
+        return os.path.join(self.path, directory, digest[:2], f"{digest}{suffix}")
+
+    def _replace(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, mode="wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def _read(self, key):
+        try:
+            with open(self._file(KEYS_DIR, _digest(key), ".json"), mode="r", encoding="utf-8") as file:
+                blob = json.load(file)["blob"]
+            with gzip.open(self._file(BLOBS_DIR, blob, ".json.gz"), mode="rt", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return MISS
+
+    def _write(self, key, value):
+        # The blob goes first, so a key never points to a missing blob
+        content = json.dumps(value, sort_keys=True).encode("utf-8")
+        blob = hashlib.sha256(content).hexdigest()
+        blob_path = self._file(BLOBS_DIR, blob, ".json.gz")
+        if not os.path.exists(blob_path):
+            # mtime=0 keeps the file bytes a function of the content
+            self._replace(blob_path, gzip.compress(content, mtime=0))
+        record = json.dumps({"key": key, "blob": blob}, sort_keys=True).encode("utf-8")
+        self._replace(self._file(KEYS_DIR, _digest(key), ".json"), record)
+
+    def lookup(self, url, params):
+        split = _split(url, params)
+        if split is None:
+            response = self._read(["request", url, params])
+        else:
+            kind, parts, _ = split
+            values = [self._read(key) for key, _ in parts]
+            if any(value is MISS for value in values):
+                response = MISS
+            elif kind == "entities":
+                response = {
+                    "entities": {
+                        qid: value for (_, qid), value in zip(parts, values) if value is not None
+                    }
+                }
+            else:
+                response = {"results": {"bindings": [b for value in values for b in value]}}
+        metrics.inc("cassette_misses" if response is MISS else "cassette_hits")
+        return response
+
+    def record(self, url, params, response):
+        split = _split(url, params)
+        with self._lock:
+            if split is None:
+                self._write(["request", url, params], response)
+            else:
+                kind, parts, var = split
+                for key, qid in parts:
+                    if kind == "entities":
+                        value = response.get("entities", {}).get(qid)
+                    else:
+                        value = [
+                            b
+                            for b in response["results"]["bindings"]
+                            if b.get(var, {}).get("value", "").split("/")[-1] == qid
+                        ]
+                    self._write(key, value)
+        metrics.inc("cassette_records")
+
+    def miss(self, url, params):
+        return CassetteMiss(
+            f"No recorded response for {url} {params} in {self.path}; "
+            "record it with HTTP_CASSETTE = 'record' or disable HTTP_CASSETTE_STRICT"
+        )
+
+    def objects(self, kind=None):
+        # Blobs before keys, which is also the order packs are unpacked in
+        for directory in (BLOBS_DIR, KEYS_DIR) if kind is None else (kind,):
+            for root, dirs, files in os.walk(os.path.join(self.path, directory)):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith((".json", ".json.gz")):
+                        yield os.path.join(root, name)
+
+    def stats(self):
+        stats = {"path": self.path}
+        size = 0
+        for kind in (KEYS_DIR, BLOBS_DIR):
+            paths = list(self.objects(kind))
+            stats[kind] = len(paths)
+            size += sum(os.path.getsize(path) for path in paths)
+        stats["size_mb"] = round(size / 2**20, 2)
+        return stats
+
+    def pack(self, output):
+        # One tar of all objects, e.g. for workers without network access
+        count = 0
+        with tarfile.open(output, mode="w") as tar:
+            for path in self.objects():
+                tar.add(path, arcname=os.path.relpath(path, self.path).replace(os.sep, "/"))
+                count += 1
+        return count
+
+    def unpack(self, pack_path):
+        # Merges a pack into this cassette; only object files are extracted
+        count = 0
+        with tarfile.open(pack_path, mode="r:*") as tar:
+            for member in tar:
+                if not member.isfile() or not OBJECT_NAME.match(member.name):
+                    logger.warning(f"Skipping unexpected pack member {member.name}")
+                    continue
+                target = os.path.join(self.path, *member.name.split("/"))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with tar.extractfile(member) as source, open(target, mode="wb") as file:
+                    file.write(source.read())
+                count += 1
+        return count
+
+
+_UNSET = object()
+_cassette = _UNSET
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    global _cassette
+    with _cassette_lock:
+        if _cassette is _UNSET:
+            # Assigned only once built, so a bad setting fails every request
+            # instead of falling back to the live network
+            if HTTP_CASSETTE:
+                _cassette = Cassette(HTTP_CASSETTE_DIR, HTTP_CASSETTE, HTTP_CASSETTE_STRICT)
+                logger.info(f"Using HTTP cassette {HTTP_CASSETTE_DIR} in {HTTP_CASSETTE} mode.")
+            else:
+                _cassette = None
+        return _cassette
+
+
+def set_cassette(cassette):
+    # Installs a cassette (None for live requests) and returns the previous one
+    global _cassette
+    with _cassette_lock:
+        previous, _cassette = _cassette, cassette
+        return previous
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, pack or unpack recorded HTTP responses.")
+    parser.add_argument("--path", default=HTTP_CASSETTE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show the number of recorded requests and response blobs.")
+    pack = commands.add_parser("pack", help="Write all recorded responses to one tar file.")
+    pack.add_argument("output")
+    unpack = commands.add_parser("unpack", help="Merge a pack into the cassette.")
+    unpack.add_argument("pack")
+    args = parser.parse_args(argv)
+
+    cassette = Cassette(args.path)
+    if args.command == "stats":
+        print(json.dumps(cassette.stats(), indent=2))
+    elif args.command == "pack":
+        count = cassette.pack(args.output)
+        logger.info(f"Packed {count} files into {args.output}")
+    elif args.command == "unpack":
+        count = cassette.unpack(args.pack)
+        logger.info(f"Unpacked {count} files into {args.path}")
+
+
+if __name__ == "__main__":
+    main()
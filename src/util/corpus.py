@@ -0,0 +1,56 @@
+import json
+import os
+
+from src.config.config import logger
+
+TEXT_EXTENSIONS = (".txt",)
+
+
+def detect_format(path):
+    if os.path.isdir(path):
+        return "dir"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "text"
+
+
+def iter_jsonl(path, text_field="text", id_field="id"):
+    with open(path, mode="r", encoding="utf-8") as file:
+        for line_no, line in enumerate(file):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield str(record.get(id_field, line_no)), record[text_field]
+
+
+def iter_text(path):
+    # One document per non-empty line
+    with open(path, mode="r", encoding="utf-8") as file:
+        for line_no, line in enumerate(file):
+            line = line.strip()
+            if line:
+                yield str(line_no), line
+
+
+def iter_directory(path):
+    # One document per text file, in a stable (sorted) order
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(TEXT_EXTENSIONS):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, mode="r", encoding="utf-8") as file:
+                yield os.path.relpath(file_path, path), file.read()
+
+
+def iter_documents(path, input_format="auto", text_field="text", id_field="id"):
+    input_format = detect_format(path) if input_format == "auto" else input_format
+    logger.info(f"Reading {input_format} documents from {path}")
+    if input_format == "jsonl":
+        return iter_jsonl(path, text_field, id_field)
+    if input_format == "text":
+        return iter_text(path)
+    if input_format == "dir":
+        return iter_directory(path)
+    raise ValueError(f"Unknown input format: {input_format}")
@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.config.config import (
+    logger,
+    BERT_MODEL,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_PERSIST,
+    EMBEDDING_CACHE_FILE,
+    ENCODE_BATCH_SIZE,
+    SQLITE_TIMEOUT,
+)
+from src.util.metrics import metrics
+from src.util.registry import get_sentence_model
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS embeddings (
+        model TEXT NOT NULL,
+        text TEXT NOT NULL,
+        vector BLOB NOT NULL,
+        PRIMARY KEY (model, text)
+    );
+"""
+# Keeps each SQL statement below SQLite's host parameter limit
+SQL_CHUNK = 500
+
+
+# Sentence embeddings by exact text, shared by every encoder caller in the
+# process. Lookups go memory (LRU) -> disk (optional) -> one model call for
+# all remaining misses.
+class EmbeddingCache:
+
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE, path=None, model_name=BERT_MODEL):
+        self.max_size = max_size
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.model_calls = 0
+        self._lru = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # WAL lets workers read while another process writes
+            self._conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _put(self, text, vector):
+        self._lru[text] = vector
+        self._lru.move_to_end(text)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _load(self, texts):
+        found = {}
+        conn = self._connection()
+        for start in range(0, len(texts), SQL_CHUNK):
+            chunk = texts[start : start + SQL_CHUNK]
+            rows = conn.execute(
+                f"SELECT text, vector FROM embeddings WHERE model = ? "
+                f"AND text IN ({', '.join('?' * len(chunk))})",
+                (self.model_name, *chunk),
+            ).fetchall()
+            found.update((text, np.frombuffer(blob, dtype=np.float32)) for text, blob in rows)
+        return found
+
+    def _store(self, vectors):
+        # Vectors that can't be stored while the database stays locked are
+        # still cached in memory; only the next process has to encode them again
+        conn = self._connection()
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(self.model_name, text, vector.tobytes()) for text, vector in vectors.items()],
+            )
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            metrics.inc("embedding_cache_write_errors")
+            logger.warning(f"Could not write to the embedding cache {self.path}: {e}")
+
+    def encode(self, texts, batch_size=ENCODE_BATCH_SIZE):
+        # (len(texts), dim) float32 matrix in input order
+        texts = list(texts)
+        vectors = {}
+        with self._lock:
+            for text in dict.fromkeys(texts):
+                vector = self._lru.get(text)
+                if vector is not None:
+                    self._lru.move_to_end(text)
+                    vectors[text] = vector
+            hits = sum(1 for text in texts if text in vectors)
+            self.hits += hits
+
+            missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+            if missing and self.path:
+                found = self._load(missing)
+                for text, vector in found.items():
+                    self._put(text, vector)
+                vectors.update(found)
+                disk_hits = sum(1 for text in texts if text in found)
+                self.disk_hits += disk_hits
+                metrics.inc("embedding_cache_disk_hits", disk_hits)
+                missing = [text for text in missing if text not in found]
+            misses = sum(1 for text in texts if text not in vectors)
+            self.misses += misses
+        metrics.inc("embedding_cache_hits", hits)
+        metrics.inc("embedding_cache_misses", misses)
+
+        if missing:
+            # The model call runs outside the lock so other threads keep hitting the cache
+            metrics.observe("encoder_batch_size", len(missing))
+            with metrics.timer("encode"):
+                encoded = np.asarray(
+                    get_sentence_model().encode(missing, batch_size=batch_size, convert_to_numpy=True),
+                    dtype=np.float32,
+                )
+            # Copied row by row: a view would keep the whole batch matrix alive
+            # for as long as any one of its rows stays in the LRU
+            new_vectors = {text: row.copy() for text, row in zip(missing, encoded)}
+            with self._lock:
+                self.model_calls += 1
+                for text, vector in new_vectors.items():
+                    self._put(text, vector)
+                if self.path:
+                    self._store(new_vectors)
+            vectors.update(new_vectors)
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([vectors[text] for text in texts])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            stats = {
+                "entries": len(self._lru),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+                "model_calls": self.model_calls,
+            }
+            if self.path and os.path.exists(self.path):
+                stats["disk_entries"] = self._connection().execute(
+                    "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)
+                ).fetchone()[0]
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self.path and os.path.exists(self.path):
+                conn = self._connection()
+                conn.execute("DELETE FROM embeddings")
+                conn.commit()
+
+
+embedding_cache = EmbeddingCache(path=EMBEDDING_CACHE_FILE if EMBEDDING_CACHE_PERSIST else None)
+
+
+def encode(texts, batch_size=ENCODE_BATCH_SIZE):
+    return embedding_cache.encode(texts, batch_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the persistent embedding cache.")
+    parser.add_argument("--path", default=EMBEDDING_CACHE_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show the number of cached embeddings.")
+    commands.add_parser("clear", help="Delete all cached embeddings.")
+    args = parser.parse_args(argv)
+
+    cache = EmbeddingCache(path=args.path)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == "clear":
+        cache.clear()
+        logger.info(f"Cleared embedding cache {args.path}")
+
+
+if __name__ == "__main__":
+    main()
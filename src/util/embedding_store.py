@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from src.config.config import (
+    logger,
+    BERT_MODEL,
+    EMBEDDING_STORE_DIR,
+    EMBEDDING_STORE_DTYPE,
+    ANN_BACKEND,
+    EMBEDDING_QUANTIZATION,
+)
+
+# On-disk layout of a property embedding store (one directory):
+#   metadata.json          format version, model, dimension, dtype, property IDs, checksum
+#   <name>.npy             label/description matrices and the flattened alias/statement
+#                          matrices, plus the CSR-style start offsets of each property's
+#                          alias/statement segment
+#   <name>.hashes.npy      content hash of the text behind each matrix row, used by
+#                          precompute_embeddings to re-encode only changed texts
+FORMAT_VERSION = 1
+METADATA_FILE = "metadata.json"
+MATRICES = ("label_embs", "description_embs", "alias_embs", "statement_embs")
+OFFSETS = ("alias_offsets", "statement_offsets")
+DTYPES = ("float32", "float16")
+HASH_SIZE = 16
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=HASH_SIZE).digest()
+
+
+def _checksum(path, names):
+    digest = hashlib.sha256()
+    for name in names:
+        with open(os.path.join(path, f"{name}.npy"), mode="rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def read_metadata(path=EMBEDDING_STORE_DIR):
+    with open(os.path.join(path, METADATA_FILE), mode="r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def exists(path=EMBEDDING_STORE_DIR):
+    return os.path.exists(os.path.join(path, METADATA_FILE))
+
+
+# Artifacts built from the store (ANN indexes, quantized matrices) live in a
+# subdirectory with their own metadata: their kind (backend or quantization),
+# the fields they cover and the checksum of the store rows they were built from
+def save_artifact_metadata(path, directory, kind, fields):
+    metadata = {"kind": kind, "fields": sorted(fields), "store": read_metadata(path)["checksum"]}
+    with open(os.path.join(path, directory, METADATA_FILE), mode="w", encoding="utf-8") as file:
+        json.dump(metadata, file)
+
+
+def read_artifact_metadata(path, directory):
+    metadata_path = os.path.join(path, directory, METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, mode="r", encoding="utf-8") as file:
+        metadata = json.load(file)
+    # Written before artifacts recorded their kind: treated as missing
+    return metadata if "kind" in metadata else None
+
+
+def artifact_current(path, directory, kind):
+    # Whether the saved artifact is of `kind` and was built from the store at `path`
+    metadata = read_artifact_metadata(path, directory)
+    return (
+        metadata is not None
+        and metadata["kind"] == kind
+        and metadata["store"] == read_metadata(path)["checksum"]
+    )
+
+
+def save_store(index, path=EMBEDDING_STORE_DIR, model=BERT_MODEL, dtype=EMBEDDING_STORE_DTYPE, hashes=None):
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported store dtype: {dtype}")
+
+    # Written next to the target and swapped in, so readers never see a partial store
+    tmp_path = f"{path.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    arrays = {}
+    for name in MATRICES:
+        arrays[name] = np.ascontiguousarray(getattr(index, name), dtype=dtype)
+    for name in OFFSETS:
+        arrays[name] = np.ascontiguousarray(getattr(index, name), dtype=np.int64)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    for name, digests in (hashes or {}).items():
+        # Raw digests as uint8 rows (numpy byte strings would drop trailing NULs)
+        digests = np.frombuffer(b"".join(digests), dtype=np.uint8).reshape(-1, HASH_SIZE)
+        np.save(os.path.join(tmp_path, f"{name}.hashes.npy"), digests)
+
+    metadata = {
+        "version": FORMAT_VERSION,
+        "model": model,
+        "dim": int(index.label_embs.shape[1]),
+        "dtype": dtype,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "properties": list(index.properties),
+        "alias_properties": list(index.alias_properties),
+        "statement_properties": list(index.statement_properties),
+        "shapes": {name: list(array.shape) for name, array in arrays.items()},
+        "hashes": sorted(hashes or {}),
+        "checksum": _checksum(tmp_path, sorted(arrays)),
+    }
+    with open(os.path.join(tmp_path, METADATA_FILE), mode="w", encoding="utf-8") as file:
+        json.dump(metadata, file)
+
+    if os.path.exists(path):
+        old_path = f"{path.rstrip(os.sep)}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        os.replace(tmp_path, path)
+
+    size = sum(array.nbytes for array in arrays.values())
+    logger.info(
+        f"Saved {len(metadata['properties'])} properties ({dtype}, {size / 2**20:.1f} MB) to {path}"
+    )
+    return metadata
+
+
+def load_store(path=EMBEDDING_STORE_DIR, mmap=True):
+    from src.steps.relationship_extraction.property_index import PropertyIndex
+
+    metadata = read_metadata(path)
+    if metadata["version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"Embedding store {path} has format version {metadata['version']}, "
+            f"expected {FORMAT_VERSION}; rebuild it with precompute_embeddings."
+        )
+    if metadata["model"] != BERT_MODEL:
+        logger.warning(
+            f"Embedding store {path} was built with {metadata['model']}, "
+            f"but BERT_MODEL is {BERT_MODEL}."
+        )
+
+    arrays = {}
+    for name in MATRICES + OFFSETS:
+        array = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        if list(array.shape) != metadata["shapes"][name]:
+            raise ValueError(f"Embedding store {path}: {name} has shape {array.shape}")
+        arrays[name] = array
+
+    index = PropertyIndex(
+        metadata["properties"],
+        arrays["label_embs"],
+        arrays["description_embs"],
+        arrays["alias_embs"],
+        arrays["alias_offsets"],
+        metadata["alias_properties"],
+        arrays["statement_embs"],
+        arrays["statement_offsets"],
+        metadata["statement_properties"],
+    )
+    if ANN_BACKEND:
+        from src.steps.relationship_extraction.ann_index import load_ann
+
+        index.ann = load_ann(index, path)
+    if EMBEDDING_QUANTIZATION:
+        from src.steps.relationship_extraction.quantized_index import load_quantized
+
+        index.quantized = load_quantized(path)
+    # Lets worker processes load the same files (and approximate indexes) instead
+    # of receiving a copy
+    index.store_path = path
+    logger.info(
+        f"Loaded {len(index.properties)} properties from embedding store {path}."
+    )
+    return index
+
+
+def load_hashes(path=EMBEDDING_STORE_DIR):
+    metadata = read_metadata(path)
+    return {
+        name: [row.tobytes() for row in np.load(os.path.join(path, f"{name}.hashes.npy"))]
+        for name in metadata.get("hashes", [])
+    }
+
+
+def verify_store(path=EMBEDDING_STORE_DIR):
+    metadata = read_metadata(path)
+    return _checksum(path, sorted(metadata["shapes"])) == metadata["checksum"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, verify or convert the property embedding store.")
+    parser.add_argument("--path", default=EMBEDDING_STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("info", help="Show the store metadata.")
+    commands.add_parser("verify", help="Check the array files against the stored checksum.")
+    convert = commands.add_parser(
+        "convert", help="Convert the legacy properties/constraints pickles into a store."
+    )
+    convert.add_argument("--dtype", choices=DTYPES, default=EMBEDDING_STORE_DTYPE)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        metadata = read_metadata(args.path)
+        metadata["properties"] = len(metadata["properties"])
+        metadata["alias_properties"] = len(metadata["alias_properties"])
+        metadata["statement_properties"] = len(metadata["statement_properties"])
+        print(json.dumps(metadata, indent=2))
+    elif args.command == "verify":
+        if not verify_store(args.path):
+            raise SystemExit(f"Checksum mismatch in {args.path}")
+        logger.info(f"Embedding store {args.path} is intact.")
+    elif args.command == "convert":
+        from src.util.data_loader import load_embedding_data
+        from src.steps.relationship_extraction.property_index import PropertyIndex
+
+        index = PropertyIndex.from_dataframes(*load_embedding_data())
+        save_store(index, args.path, dtype=args.dtype)
+
+
+if __name__ == "__main__":
+    main()
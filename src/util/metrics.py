@@ -0,0 +1,168 @@
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.config.config import logger, SERVER_HOST
+
+PREFIX = "text2kg"
+
+
+# Process-wide stage timers, event counters and value summaries (e.g. batch
+# sizes). Cheap enough to stay on in production: one lock and a few additions
+# per event.
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.timers = {}  # stage -> [calls, seconds, max seconds]
+            self.counters = {}  # name -> count
+            self.summaries = {}  # name -> [observations, sum, max]
+
+    def _observe(self, table, name, value):
+        with self._lock:
+            entry = table.get(name)
+            if entry is None:
+                table[name] = [1, value, value]
+            else:
+                entry[0] += 1
+                entry[1] += value
+                entry[2] = max(entry[2], value)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe(self.timers, stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        self._observe(self.summaries, name, value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "stages": {
+                    stage: {"calls": calls, "seconds": round(total, 6), "max_seconds": round(peak, 6)}
+                    for stage, (calls, total, peak) in sorted(self.timers.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "summaries": {
+                    name: {"count": count, "sum": total, "max": peak}
+                    for name, (count, total, peak) in sorted(self.summaries.items())
+                },
+            }
+
+    def merge(self, snapshot):
+        # Adds a snapshot taken in another process (e.g. a pool worker)
+        with self._lock:
+            for stage, values in snapshot["stages"].items():
+                self._merge(self.timers, stage, values["calls"], values["seconds"], values["max_seconds"])
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, values in snapshot["summaries"].items():
+                self._merge(self.summaries, name, values["count"], values["sum"], values["max"])
+
+    @staticmethod
+    def _merge(table, name, count, total, peak):
+        entry = table.setdefault(name, [0, 0, peak])
+        entry[0] += count
+        entry[1] += total
+        entry[2] = max(entry[2], peak)
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = [
+            f"# TYPE {PREFIX}_stage_seconds_total counter",
+            *(
+                f'{PREFIX}_stage_seconds_total{{stage="{stage}"}} {values["seconds"]}'
+                for stage, values in snapshot["stages"].items()
+            ),
+            f"# TYPE {PREFIX}_stage_calls_total counter",
+            *(
+                f'{PREFIX}_stage_calls_total{{stage="{stage}"}} {values["calls"]}'
+                for stage, values in snapshot["stages"].items()
+            ),
+            f"# TYPE {PREFIX}_stage_max_seconds gauge",
+            *(
+                f'{PREFIX}_stage_max_seconds{{stage="{stage}"}} {values["max_seconds"]}'
+                for stage, values in snapshot["stages"].items()
+            ),
+        ]
+        for name, value in snapshot["counters"].items():
+            lines += [f"# TYPE {PREFIX}_{name}_total counter", f"{PREFIX}_{name}_total {value}"]
+        for name, values in snapshot["summaries"].items():
+            lines += [
+                f"# TYPE {PREFIX}_{name} summary",
+                f"{PREFIX}_{name}_count {values['count']}",
+                f"{PREFIX}_{name}_sum {values['sum']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        with open(path, mode="w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+
+metrics = Metrics()
+timer = metrics.timer
+timed = metrics.timed
+inc = metrics.inc
+observe = metrics.observe
+
+
+# Serves /metrics (Prometheus text) and /metrics.json; other services extend it
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def send_body(self, status, body, content_type, headers=None):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.send_body(200, metrics.prometheus(), "text/plain; version=0.0.4")
+        elif self.path == "/metrics.json":
+            self.send_body(200, json.dumps(metrics.snapshot()), "application/json")
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        logger.debug("%s: " + format, type(self).__name__, *args)
+
+
+def serve_metrics(port, host=SERVER_HOST):
+    # Serves /metrics (Prometheus text) and /metrics.json from a daemon thread
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -1,10 +1,29 @@
+import argparse
+
 import numpy as np
 import pandas as pd
 
-from sentence_transformers import SentenceTransformer
-from src.config.config import BERT_MODEL, PROPERTIES_FILE, CONSTRAINTS_FILE, logger
-
-bert_model = SentenceTransformer(BERT_MODEL)
+from src.config.config import (
+    logger,
+    BERT_MODEL,
+    PROPERTIES_FILE,
+    CONSTRAINTS_FILE,
+    EMBEDDING_STORE_DIR,
+    EMBEDDING_STORE_DTYPE,
+    ANN_BACKEND,
+    EMBEDDING_QUANTIZATION,
+    PRECOMPUTE_BATCH_SIZE,
+)
+from src.steps.relationship_extraction.ann_index import ann_current, build_ann, save_ann
+from src.steps.relationship_extraction.property_index import PropertyIndex
+from src.steps.relationship_extraction.quantized_index import (
+    quantize_index,
+    quantized_current,
+    save_quantized,
+)
+from src.util import embedding_store
+from src.util.embedding_store import save_store, text_hash
+from src.util.registry import get_sentence_model
 
 
 def normalize(emb):
@@ -16,42 +35,205 @@ def normalize(emb):
     return emb / np.linalg.norm(emb, axis=1, keepdims=True)
 
 
-def get_list_embs(text_list, sep):
+def split_list(text_list, sep):
     if pd.isna(text_list):
-        return None
-    text_list = [s.strip() for s in text_list.split(sep) if s.strip()]
-    if not text_list:
-        return None
-    emb = bert_model.encode(text_list, convert_to_numpy=True)
-    return normalize(emb)
+        return []
+    return [s.strip() for s in text_list.split(sep) if s.strip()]
+
+
+def read_texts(properties_file=PROPERTIES_FILE, constraints_file=CONSTRAINTS_FILE):
+    # Texts behind every row of the store: one label and description per property,
+    # a ragged list of aliases per property and of statements per constraint
+    logger.info(f"Loading properties from {properties_file}")
+    properties = pd.read_csv(properties_file)
+    logger.info(f"Loading constraints from {constraints_file}")
+    constraints = pd.read_csv(constraints_file)
+
+    return {
+        "properties": properties["property"].tolist(),
+        "labels": properties["label"].fillna("").astype(str).tolist(),
+        "descriptions": properties["description"].fillna("").astype(str).tolist(),
+        "aliases": list(zip(properties["property"], properties["aliases"].apply(split_list, sep=","))),
+        "statements": list(
+            zip(constraints["property"], constraints["statements"].apply(split_list, sep="."))
+        ),
+    }
+
+
+def _ragged(entries):
+    # Flattens (property, texts) pairs into texts, segment start offsets and the
+    # properties that have at least one text, as PropertyIndex expects
+    texts, offsets, properties = [], [], []
+    for prop, items in entries:
+        if not items:
+            continue
+        properties.append(prop)
+        offsets.append(len(texts))
+        texts.extend(items)
+    return texts, np.asarray(offsets, dtype=np.int64), properties
+
+
+def load_previous(path):
+    # Embeddings of the existing store by text hash; nothing is reused when the
+    # store is missing, predates text hashes, was built with another model or
+    # holds less precision than EMBEDDING_STORE_DTYPE
+    if not embedding_store.exists(path):
+        return {}
+    metadata = embedding_store.read_metadata(path)
+    if metadata["model"] != BERT_MODEL:
+        logger.info(f"Existing store was built with {metadata['model']}; re-encoding everything.")
+        return {}
+    if np.dtype(metadata["dtype"]).itemsize < np.dtype(EMBEDDING_STORE_DTYPE).itemsize:
+        logger.info(f"Existing store is {metadata['dtype']}; re-encoding everything.")
+        return {}
+    hashes = embedding_store.load_hashes(path)
+    if not hashes:
+        logger.info("Existing store has no text hashes; re-encoding everything.")
+        return {}
+
+    index = embedding_store.load_store(path)
+    previous = {}
+    for name, digests in hashes.items():
+        matrix = getattr(index, name)
+        for row, digest in enumerate(digests):
+            previous.setdefault(digest, (matrix, row))
+    return previous
+
+
+def encode_texts(texts, previous, batch_size=PRECOMPUTE_BATCH_SIZE):
+    # One normalized embedding per text; only texts without a previous embedding
+    # are encoded, deduplicated, in one batched call
+    digests = [text_hash(text) for text in texts]
+    missing = {}
+    for text, digest in zip(texts, digests):
+        if digest not in previous:
+            missing.setdefault(digest, text)
 
+    encoded = {}
+    if missing:
+        logger.info(f"Encoding {len(missing)} new or changed texts (batch size {batch_size}).")
+        embs = normalize(
+            get_sentence_model().encode(
+                list(missing.values()),
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=len(missing) > batch_size,
+            )
+        )
+        encoded = dict(zip(missing, embs))
 
-logger.info("Loading properties from %s", PROPERTIES_FILE)
-properties = pd.read_csv(PROPERTIES_FILE)
+    reused = sum(1 for digest in set(digests) if digest in previous)
+    logger.info(f"Reused {reused} embeddings from the existing store.")
+    return encoded, digests
 
-logger.info("Encoding and normalizing property labels.")
-properties["label_emb"] = normalize(
-    bert_model.encode(properties["label"].fillna("").astype(str), convert_to_numpy=True)
-).tolist()
 
-logger.info("Encoding and normalizing property descriptions.")
-properties["description_emb"] = normalize(
-    bert_model.encode(
-        properties["description"].fillna("").astype(str), convert_to_numpy=True
+def _dim(encoded, previous):
+    for emb in encoded.values():
+        return len(emb)
+    for matrix, _ in previous.values():
+        return matrix.shape[1]
+    return get_sentence_model().get_sentence_embedding_dimension()
+
+
+def build_index(texts, previous, batch_size=PRECOMPUTE_BATCH_SIZE):
+    alias_texts, alias_offsets, alias_properties = _ragged(texts["aliases"])
+    statement_texts, statement_offsets, statement_properties = _ragged(texts["statements"])
+    fields = {
+        "label_embs": texts["labels"],
+        "description_embs": texts["descriptions"],
+        "alias_embs": alias_texts,
+        "statement_embs": statement_texts,
+    }
+
+    # All fields share one encode call
+    all_texts = [text for field_texts in fields.values() for text in field_texts]
+    encoded, all_digests = encode_texts(all_texts, previous, batch_size)
+    dim = _dim(encoded, previous)
+
+    matrices, hashes = {}, {}
+    start = 0
+    for name, field_texts in fields.items():
+        digests = all_digests[start : start + len(field_texts)]
+        start += len(field_texts)
+        matrix = np.empty((len(digests), dim), dtype=np.float32)
+        for row, digest in enumerate(digests):
+            if digest in encoded:
+                matrix[row] = encoded[digest]
+            else:
+                previous_matrix, previous_row = previous[digest]
+                matrix[row] = previous_matrix[previous_row]
+        matrices[name] = matrix
+        hashes[name] = digests
+
+    index = PropertyIndex(
+        texts["properties"],
+        matrices["label_embs"],
+        matrices["description_embs"],
+        matrices["alias_embs"],
+        alias_offsets,
+        alias_properties,
+        matrices["statement_embs"],
+        statement_offsets,
+        statement_properties,
+    )
+    return index, hashes, len(encoded)
+
+
+def _unchanged(index, hashes, path):
+    metadata = embedding_store.read_metadata(path)
+    old_hashes = embedding_store.load_hashes(path)
+    return (
+        metadata["dtype"] == EMBEDDING_STORE_DTYPE
+        and metadata["properties"] == index.properties
+        and metadata["alias_properties"] == index.alias_properties
+        and metadata["statement_properties"] == index.statement_properties
+        and old_hashes == hashes
     )
-).tolist()
 
-logger.info("Encoding and normalizing property aliases.")
-properties["aliases_emb"] = properties["aliases"].apply(get_list_embs, sep=",")
 
-logger.info("Saving properties with embeddings to properties_with_emb.pkl")
-properties.to_pickle("properties_with_emb.pkl")
+def precompute(
+    output=EMBEDDING_STORE_DIR,
+    batch_size=PRECOMPUTE_BATCH_SIZE,
+    full=False,
+    properties_file=PROPERTIES_FILE,
+    constraints_file=CONSTRAINTS_FILE,
+):
+    texts = read_texts(properties_file, constraints_file)
+    previous = {} if full else load_previous(output)
+    index, hashes, encoded = build_index(texts, previous, batch_size)
+
+    changed = full or encoded > 0 or not previous or not _unchanged(index, hashes, output)
+    if changed:
+        save_store(index, output, BERT_MODEL, EMBEDDING_STORE_DTYPE, hashes)
+    else:
+        logger.info(f"Embedding store {output} is up to date.")
+
+    # Both are derived from every row, so they are rebuilt whenever the store
+    # changes, and also when missing or built with other settings
+    if ANN_BACKEND and (changed or not ann_current(output, ANN_BACKEND)):
+        backend, anns = build_ann(index, ANN_BACKEND)
+        save_ann(anns, backend, output)
+
+    if EMBEDDING_QUANTIZATION and (changed or not quantized_current(output, EMBEDDING_QUANTIZATION)):
+        quantized = quantize_index(index, EMBEDDING_QUANTIZATION)
+        save_quantized(quantized, EMBEDDING_QUANTIZATION, output)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Encode property labels, descriptions, aliases and constraint statements "
+        "into the embedding store, re-encoding only new or changed texts."
+    )
+    parser.add_argument("--output", default=EMBEDDING_STORE_DIR)
+    parser.add_argument("--batch-size", type=int, default=PRECOMPUTE_BATCH_SIZE)
+    parser.add_argument("--full", action="store_true", help="Re-encode every text")
+    parser.add_argument("--properties", default=PROPERTIES_FILE)
+    parser.add_argument("--constraints", default=CONSTRAINTS_FILE)
+    args = parser.parse_args(argv)
 
-logger.info("Loading constraints from %s", CONSTRAINTS_FILE)
-constraints = pd.read_csv(CONSTRAINTS_FILE)
+    precompute(args.output, args.batch_size, args.full, args.properties, args.constraints)
 
-logger.info("Encoding and normalizing constraint statements.")
-constraints["statements_emb"] = constraints["statements"].apply(get_list_embs, sep=".")
 
-logger.info("Saving constraints with embeddings to constraints_with_emb.pkl")
-constraints.to_pickle("constraints_with_emb.pkl")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.config.config import (
+    logger,
+    QID_CACHE_FILE,
+    QID_CACHE_TTL,
+    QID_CACHE_LRU_SIZE,
+    SQLITE_TIMEOUT,
+)
+from src.util.metrics import metrics
+
+# Returned by lookups that have no (fresh) entry, since None is a cached negative result
+MISS = object()
+
+# Bumped when the tables change; an older cache is dropped and refilled
+SCHEMA_VERSION = 2
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS candidates (
+        source TEXT NOT NULL,
+        term TEXT NOT NULL,
+        language TEXT NOT NULL,
+        candidates TEXT NOT NULL,
+        texts TEXT,
+        embeddings BLOB,
+        dim INTEGER,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (source, term, language)
+    );
+    CREATE TABLE IF NOT EXISTS decisions (
+        source TEXT NOT NULL,
+        label TEXT NOT NULL,
+        language TEXT NOT NULL,
+        threshold REAL NOT NULL,
+        qid TEXT,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (source, label, language, threshold)
+    );
+"""
+
+
+def normalize_label(label):
+    return " ".join(label.lower().split())
+
+
+class QidCache:
+
+    def __init__(self, path=QID_CACHE_FILE, ttl=QID_CACHE_TTL, lru_size=QID_CACHE_LRU_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # WAL lets workers read while another process writes
+            self._conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._conn.executescript(
+                    "DROP TABLE IF EXISTS candidates; DROP TABLE IF EXISTS decisions; "
+                    f"PRAGMA user_version = {SCHEMA_VERSION};"
+                )
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _write(self, sql, params):
+        # A write that still finds the database locked is skipped: the entry is
+        # kept in memory, and only the next process has to look it up again
+        conn = self._connection()
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            metrics.inc("qid_cache_write_errors")
+            logger.warning(f"Could not write to the QID cache {self.path}: {e}")
+
+    def _fresh(self, created_at):
+        return self.ttl is None or time.time() - created_at < self.ttl
+
+    def _lru_get(self, key):
+        entry = self._lru.get(key)
+        if entry is None:
+            return MISS
+        value, created_at = entry
+        if not self._fresh(created_at):
+            del self._lru[key]
+            return MISS
+        self._lru.move_to_end(key)
+        return value
+
+    def _lru_put(self, key, value, created_at):
+        self._lru[key] = (value, created_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _count(self, value):
+        if value is MISS:
+            self.misses += 1
+            metrics.inc("qid_cache_misses")
+        else:
+            self.hits += 1
+            metrics.inc("qid_cache_hits")
+        return value
+
+    # Entries are kept per backend source (see wikidata_backend), so answers of
+    # one backend or store build are never served for another
+    def get_decision(self, source, label, language, threshold):
+        key = ("decision", source, normalize_label(label), language, float(threshold))
+        with self._lock:
+            value = self._lru_get(key)
+            if value is MISS:
+                row = self._connection().execute(
+                    "SELECT qid, created_at FROM decisions "
+                    "WHERE source = ? AND label = ? AND language = ? AND threshold = ?",
+                    key[1:],
+                ).fetchone()
+                if row is not None and self._fresh(row[1]):
+                    value = row[0]
+                    self._lru_put(key, value, row[1])
+            return self._count(value)
+
+    def put_decision(self, source, label, language, threshold, qid):
+        key = ("decision", source, normalize_label(label), language, float(threshold))
+        created_at = time.time()
+        with self._lock:
+            self._write(
+                "INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?, ?, ?)",
+                (*key[1:], qid, created_at),
+            )
+            self._lru_put(key, qid, created_at)
+
+    def get_candidates(self, source, term, language):
+        # Returns (candidates, {text: embedding}) or MISS
+        key = ("candidates", source, normalize_label(term), language)
+        with self._lock:
+            value = self._lru_get(key)
+            if value is MISS:
+                row = self._connection().execute(
+                    "SELECT candidates, texts, embeddings, dim, created_at FROM candidates "
+                    "WHERE source = ? AND term = ? AND language = ?",
+                    key[1:],
+                ).fetchone()
+                if row is not None and self._fresh(row[4]):
+                    value = (json.loads(row[0]), _decode_embeddings(row[1], row[2], row[3]))
+                    self._lru_put(key, value, row[4])
+            return self._count(value)
+
+    def put_candidates(self, source, term, language, candidates, embeddings=None):
+        key = ("candidates", source, normalize_label(term), language)
+        embeddings = embeddings or {}
+        texts, blob, dim = _encode_embeddings(embeddings)
+        created_at = time.time()
+        with self._lock:
+            self._write(
+                "INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key[1:], json.dumps(candidates), texts, blob, dim, created_at),
+            )
+            self._lru_put(key, (candidates, dict(embeddings)), created_at)
+
+    def purge_expired(self):
+        if self.ttl is None:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            conn = self._connection()
+            removed = conn.execute(
+                "DELETE FROM candidates WHERE created_at < ?", (cutoff,)
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM decisions WHERE created_at < ?", (cutoff,)
+            ).rowcount
+            conn.commit()
+            self._lru.clear()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM candidates")
+            conn.execute("DELETE FROM decisions")
+            conn.commit()
+            self._lru.clear()
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            candidates = conn.execute("SELECT COUNT(*) FROM candidates").fetchone()[0]
+            decisions, negatives = conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(qid) FROM decisions"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "candidates": candidates,
+            "decisions": decisions,
+            "negative_decisions": negatives,
+            "lru_entries": len(self._lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _encode_embeddings(embeddings):
+    if not embeddings:
+        return None, None, None
+    texts = list(embeddings)
+    matrix = np.asarray([embeddings[t] for t in texts], dtype=np.float32)
+    return json.dumps(texts), matrix.tobytes(), matrix.shape[1]
+
+
+def _decode_embeddings(texts, blob, dim):
+    if not texts:
+        return {}
+    matrix = np.frombuffer(blob, dtype=np.float32).reshape(-1, dim)
+    return dict(zip(json.loads(texts), matrix))
+
+
+qid_cache = QidCache()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or warm the entity-linking cache.")
+    parser.add_argument("--path", default=QID_CACHE_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("stats", help="Show cache size and negative entries.")
+
+    lookup = commands.add_parser("lookup", help="Show the cached entries for a label.")
+    lookup.add_argument("label")
+    lookup.add_argument("--language", default="en")
+    lookup.add_argument("--threshold", type=float, default=0.9)
+
+    warm = commands.add_parser("warm", help="Resolve every label in a file (one per line).")
+    warm.add_argument("labels_file")
+    warm.add_argument("--language", default="en")
+    warm.add_argument("--threshold", type=float, default=0.9)
+
+    commands.add_parser("purge", help="Delete expired entries.")
+    commands.add_parser("clear", help="Delete all entries.")
+
+    args = parser.parse_args(argv)
+    cache = qid_cache if args.path == QID_CACHE_FILE else QidCache(args.path)
+
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == "lookup":
+        # Entries of the configured backend
+        from src.util.wikidata_backend import get_backend
+
+        source = get_backend().source
+        decision = cache.get_decision(source, args.label, args.language, args.threshold)
+        candidates = cache.get_candidates(source, args.label, args.language)
+        print(
+            json.dumps(
+                {
+                    "source": source,
+                    "label": normalize_label(args.label),
+                    "cached": decision is not MISS,
+                    "qid": None if decision is MISS else decision,
+                    "candidates": None if candidates is MISS else candidates[0],
+                },
+                indent=2,
+            )
+        )
+    elif args.command == "warm":
+        # Imported here so that inspecting the cache does not load the encoder
+        from src.util import qid_retriever
+
+        qid_retriever.qid_cache = cache
+        with open(args.labels_file, encoding="utf-8") as file:
+            labels = [line.strip() for line in file if line.strip()]
+        for label in labels:
+            qid_retriever.get_wikidata_qid(label, args.language, args.threshold)
+        logger.info(f"Warmed cache with {len(labels)} labels.")
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == "purge":
+        logger.info(f"Removed {cache.purge_expired()} expired entries.")
+    elif args.command == "clear":
+        cache.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,111 +1,128 @@
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-
-from src.config.config import logger, WIKIDATA_API_URL, BERT_MODEL
-from src.util.sparql_service import execute_request_with_retries
-
-bert_model = SentenceTransformer(BERT_MODEL)
+import logging
+from functools import partial
 
-def _cos(a: np.ndarray, b: np.ndarray) -> float:
-    return float(cosine_similarity(a.reshape(1, -1), b.reshape(1, -1))[0, 0])
+import numpy as np
 
-def _encode(texts):
-    return bert_model.encode(texts, convert_to_numpy=True)
+from src.config.config import logger, CANDIDATE_LIMIT, QID_CACHE_ENABLED
+from src.util.wikidata_backend import get_backend
+from src.util.qid_cache import qid_cache, MISS
+from src.util.embedding_cache import encode
+from src.util.scheduler import scheduler
 
 def _fetch_candidates(term: str, language: str, limit: int):
-    params = {
-        "action": "wbsearchentities",
-        "search": term,
-        "language": language,
-        "format": "json",
-        "limit": limit,
-    }
-    search = execute_request_with_retries(
-        url=WIKIDATA_API_URL, params=params, rotating_user_agent=False
-    )
-    items = search.get("search", [])
+    backend = get_backend()
+    items = backend.search_entities(term, language, limit)
     if not items:
         return []
 
-    qids = [it["id"] for it in items]
-    params = {
-        "action": "wbgetentities",
-        "ids": "|".join(qids),
-        "props": "aliases|labels",
-        "languages": language,
-        "format": "json",
-    }
-    entities = execute_request_with_retries(
-        url=WIKIDATA_API_URL, params=params, rotating_user_agent=False
-    ).get("entities", {})
+    entities = backend.get_entities([it["id"] for it in items], language)
 
     out = []
     for item in items:
         qid = item["id"]
         ent = entities.get(qid, {})
-        label = ent.get("labels", {}).get(language, {}).get("value", item.get("label", ""))
-        aliases = [a["value"] for a in ent.get("aliases", {}).get(language, [])]
+        label = ent.get("label") or item.get("label", "")
+        aliases = ent.get("aliases", [])
         out.append({"id": qid, "label": label, "aliases": aliases})
     return out
 
-def get_wikidata_qid(entity_label, language="en", threshold=0.9):
-    logger.info(f"Fetching QID for entity: {entity_label}")
-
-    candidates = _fetch_candidates(entity_label, language=language, limit=10)
-    if not candidates:
-        logger.warning("No candidates found.")
-        return None
-
-    logger.info("Candidates from search: " + ", ".join(c.get("label", "") for c in candidates))
-
-    entity_label = entity_label.lower().strip()
-
+def _get_candidates(search_term, language):
+    # (candidates, {text: embedding}) from the candidate cache, else from the backend
+    source = get_backend().source
+    cached = qid_cache.get_candidates(source, search_term, language) if QID_CACHE_ENABLED else MISS
+    if cached is not MISS:
+        return cached
+    candidates = _fetch_candidates(search_term, language=language, limit=CANDIDATE_LIMIT)
+    if QID_CACHE_ENABLED:
+        qid_cache.put_candidates(source, search_term, language, candidates)
+    return candidates, {}
+
+def _exact_match(entity_label, candidates):
     for candidate in candidates:
         label_norm = candidate.get("label", "").lower().strip()
         if label_norm == entity_label:
-            logger.info(f"Exact label match for '{entity_label}': {candidate['id']}")
+            logger.debug("Exact label match for '%s': %s", entity_label, candidate["id"])
             return candidate["id"]
         for alias in candidate.get("aliases", []):
             if alias.lower().strip() == entity_label:
-                logger.info(f"Exact alias match for '{entity_label}': {candidate['id']}")
+                logger.debug("Exact alias match for '%s': %s", entity_label, candidate["id"])
                 return candidate["id"]
+    return None
 
-    entity_emb = _encode([entity_label])[0]
-    scored = []
-    for candidate in candidates:
-        cand_label = candidate.get("label", "")
-        aliases = candidate.get("aliases", [])
-
-        label_sim = 0.0
-        if cand_label:
-            label_vec = _encode([cand_label])[0]
-            label_sim = _cos(entity_emb, label_vec)
-
-        alias_sims = []
-        if aliases:
-            alias_vecs = _encode(aliases)
-            alias_sims = [_cos(entity_emb, av) for av in alias_vecs]
-
-        alias_avg_sim = float(np.mean(alias_sims)) if alias_sims else 0.0
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def _score(mentions):
+    # mentions: [(entity_label, candidates, vectors)]. Scores every candidate of
+    # every mention at once: one encode for all texts not cached yet, then row-wise
+    # cosine similarities of unit vectors and a mean per candidate alias segment.
+    # Returns, per mention, candidate dicts with label_sim and alias_avg_sim.
+    texts = {}
+    mention_rows, label_rows, alias_rows, alias_candidates = [], [], [], []
+    candidate_refs = []
+    for m, (entity_label, candidates, _) in enumerate(mentions):
+        entity_row = texts.setdefault(entity_label, len(texts))
+        for candidate in candidates:
+            c = len(candidate_refs)
+            candidate_refs.append((m, candidate))
+            mention_rows.append(entity_row)
+            label = candidate.get("label", "")
+            label_rows.append(texts.setdefault(label, len(texts)) if label else -1)
+            for alias in candidate.get("aliases", []):
+                alias_rows.append(texts.setdefault(alias, len(texts)))
+                alias_candidates.append(c)
+
+    # Embeddings cached with the candidates are reused; the rest is encoded in one call
+    known = {}
+    for _, _, vectors in mentions:
+        known.update(vectors)
+    text_list = list(texts)
+    missing = [text for text in text_list if text not in known]
+    if missing:
+        known.update(zip(missing, encode(missing)))
+    matrix = _unit([known[text] for text in text_list])
+
+    mention_rows = np.asarray(mention_rows, dtype=np.int64)
+    label_rows = np.asarray(label_rows, dtype=np.int64)
+    label_sims = np.einsum("ij,ij->i", matrix[mention_rows], matrix[label_rows])
+    label_sims[label_rows < 0] = 0.0
+
+    alias_sums = np.zeros(len(candidate_refs), dtype=np.float64)
+    alias_counts = np.zeros(len(candidate_refs), dtype=np.int64)
+    if alias_rows:
+        alias_candidates = np.asarray(alias_candidates, dtype=np.int64)
+        alias_sims = np.einsum(
+            "ij,ij->i", matrix[mention_rows[alias_candidates]], matrix[np.asarray(alias_rows)]
+        )
+        np.add.at(alias_sums, alias_candidates, alias_sims)
+        np.add.at(alias_counts, alias_candidates, 1)
+    alias_avg_sims = np.divide(
+        alias_sums, alias_counts, out=np.zeros_like(alias_sums), where=alias_counts > 0
+    )
 
-        scored.append(
+    scored = [[] for _ in mentions]
+    for (m, candidate), label_sim, alias_avg_sim in zip(candidate_refs, label_sims, alias_avg_sims):
+        scored[m].append(
             {
                 "id": candidate["id"],
-                "label": cand_label,
-                "aliases": aliases,
-                "label_sim": label_sim,
-                "alias_avg_sim": alias_avg_sim
+                "label": candidate.get("label", ""),
+                "aliases": candidate.get("aliases", []),
+                "label_sim": float(label_sim),
+                "alias_avg_sim": float(alias_avg_sim)
             }
         )
+    return scored, known
 
+def _decide(entity_label, scored, threshold):
     scored.sort(key=lambda x: (x["alias_avg_sim"], x["label_sim"]), reverse=True)
     best_candidate = scored[0]
 
     if best_candidate["label_sim"] >= threshold:
         if best_candidate["alias_avg_sim"] == 0:
-            logger.info(
-                f"QID for {entity_label}: {best_candidate['id']} (label match)"
+            logger.debug(
+                "QID for %s: %s (label match)", entity_label, best_candidate["id"]
             )
             return best_candidate["id"]
         else:
@@ -113,10 +130,81 @@ def get_wikidata_qid(entity_label, language="en", threshold=0.9):
                 [best_candidate["label_sim"], best_candidate["alias_avg_sim"]]
             )
             if label_aliases_sim >= threshold:
-                logger.info(
-                    f"QID for {entity_label}: {best_candidate['id']} (label+alias match)"
+                logger.debug(
+                    "QID for %s: %s (label+alias match)", entity_label, best_candidate["id"]
                 )
                 return best_candidate["id"]
 
-    logger.warning(f"No QID found for {entity_label}")
+    logger.debug("No QID found for %s", entity_label)
     return None
+
+def get_wikidata_qids(entity_labels, language="en", threshold=0.9):
+    # Links every distinct label of a batch: cached decisions first, then candidate
+    # searches run concurrently, then one scoring pass over all remaining mentions
+    labels = list(dict.fromkeys(entity_labels))
+    source = get_backend().source
+    qids = {}
+    pending = []
+    for entity_label in labels:
+        logger.debug("Fetching QID for entity: %s", entity_label)
+        if QID_CACHE_ENABLED:
+            cached_qid = qid_cache.get_decision(source, entity_label, language, threshold)
+            if cached_qid is not MISS:
+                logger.debug("Cached QID for %s: %s", entity_label, cached_qid)
+                qids[entity_label] = cached_qid
+                continue
+        pending.append(entity_label)
+
+    fetched = scheduler.map_unique(
+        ("candidates", language), partial(_get_candidates, language=language), pending
+    )
+
+    to_score = []
+    for entity_label in pending:
+        candidates, vectors = fetched[entity_label]
+        if not candidates:
+            logger.debug("No candidates found for %s", entity_label)
+            qids[entity_label] = None
+            continue
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Candidates from search: %s", ", ".join(c.get("label", "") for c in candidates)
+            )
+        qid = _exact_match(entity_label.lower().strip(), candidates)
+        if qid is not None:
+            qids[entity_label] = qid
+            continue
+        to_score.append(entity_label)
+
+    if to_score:
+        scored, known = _score(
+            [
+                (entity_label.lower().strip(), *fetched[entity_label])
+                for entity_label in to_score
+            ]
+        )
+        for entity_label, candidate_scores in zip(to_score, scored):
+            candidates, vectors = fetched[entity_label]
+            if QID_CACHE_ENABLED:
+                texts = [entity_label.lower().strip()] + [
+                    text
+                    for c in candidates
+                    for text in ([c["label"]] if c.get("label") else []) + c.get("aliases", [])
+                ]
+                if any(text not in vectors for text in texts):
+                    qid_cache.put_candidates(
+                        source,
+                        entity_label,
+                        language,
+                        candidates,
+                        {text: known[text] for text in texts},
+                    )
+            qids[entity_label] = _decide(entity_label.lower().strip(), candidate_scores, threshold)
+
+    if QID_CACHE_ENABLED:
+        for entity_label in pending:
+            qid_cache.put_decision(source, entity_label, language, threshold, qids[entity_label])
+    return {entity_label: qids[entity_label] for entity_label in labels}
+
+def get_wikidata_qid(entity_label, language="en", threshold=0.9):
+    return get_wikidata_qids([entity_label], language, threshold)[entity_label]
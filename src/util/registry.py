@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from src.config.config import logger, BERT_MODEL, SPACY_MODEL, NER_MODEL
+
+# Models and indexes are loaded lazily, once per process, on first use.
+# Heavy imports live inside the loaders so importing a module is cheap.
+_loaders = {}
+_resources = {}
+_stats = {}
+_lock = threading.RLock()
+
+
+def register(name):
+    def decorator(loader):
+        _loaders[name] = loader
+        return loader
+
+    return decorator
+
+
+@register("sentence_transformer")
+def _load_sentence_transformer():
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(BERT_MODEL)
+
+
+@register("spacy")
+def _load_spacy():
+    # One spaCy pipeline for both steps: coreference runs it with fastcoref,
+    # clause extraction with fastcoref disabled
+    import spacy
+    from fastcoref import spacy_component  # registers the "fastcoref" factory
+
+    nlp = spacy.load(SPACY_MODEL)
+    nlp.add_pipe("fastcoref")
+    return nlp
+
+
+@register("sentencizer")
+def _load_sentencizer():
+    # Rule-based sentence splitting only, for cutting long texts into windows
+    import spacy
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    return nlp
+
+
+@register("ner")
+def _load_ner():
+    from transformers import pipeline
+
+    return pipeline(
+        "ner",
+        model=NER_MODEL,
+        grouped_entities=True,
+    )
+
+
+@register("property_data")
+def _load_property_data():
+    from src.util.data_loader import load_property_data
+
+    return load_property_data()
+
+
+@register("property_index")
+def _load_property_index():
+    from src.util import embedding_store
+
+    if embedding_store.exists():
+        return embedding_store.load_store()
+
+    from src.util.data_loader import load_embedding_data
+    from src.steps.relationship_extraction.property_index import PropertyIndex
+
+    logger.warning(
+        "No embedding store found; falling back to the legacy pickles. "
+        "Run `python -m src.util.embedding_store convert` to build the store."
+    )
+    properties_with_emb, constraints_with_emb = load_embedding_data()
+    return PropertyIndex.from_dataframes(properties_with_emb, constraints_with_emb)
+
+
+@register("constraint_index")
+def _load_constraint_index():
+    from src.steps.relationship_extraction.constraints_matching import ConstraintIndex
+
+    _, constraints_data = get("property_data")
+    return ConstraintIndex(constraints_data)
+
+
+def _rss_bytes():
+    # None where neither /proc nor the Unix-only resource module is available (Windows)
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak RSS, reported in bytes on macOS and kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _mb(value):
+    return None if value is None else round(value / 2**20, 1)
+
+
+def _parameter_bytes(resource_obj):
+    model = getattr(resource_obj, "model", resource_obj)
+    parameters = getattr(model, "parameters", None)
+    if parameters is None:
+        return None
+    return sum(p.numel() * p.element_size() for p in parameters())
+
+
+def get(name):
+    resource_obj = _resources.get(name)
+    if resource_obj is not None:
+        return resource_obj
+    with _lock:
+        if name not in _resources:
+            if name not in _loaders:
+                raise KeyError(f"Unknown resource: {name}")
+            logger.info(f"Loading {name}...")
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            resource_obj = _loaders[name]()
+            load_seconds = time.perf_counter() - start
+            rss_after = _rss_bytes()
+            _stats[name] = {
+                "load_seconds": round(load_seconds, 3),
+                "rss_delta_mb": None if rss_before is None else _mb(rss_after - rss_before),
+                "parameters_mb": _mb(_parameter_bytes(resource_obj)),
+            }
+            _resources[name] = resource_obj
+            logger.info(f"Loaded {name} in {load_seconds:.1f}s.")
+        return _resources[name]
+
+
+def provide(name, resource_obj):
+    # Installs an already-built resource (e.g. one shared by a parent process)
+    with _lock:
+        _resources[name] = resource_obj
+        _stats[name] = {"load_seconds": 0.0, "rss_delta_mb": None, "parameters_mb": None}
+
+
+def is_loaded(name):
+    return name in _resources
+
+
+def warmup(names=None):
+    for name in names or list(_loaders):
+        get(name)
+    return report()
+
+
+def report():
+    with _lock:
+        return {
+            "resources": {name: dict(stats) for name, stats in _stats.items()},
+            "rss_mb": _mb(_rss_bytes()),
+        }
+
+
+def get_sentence_model():
+    return get("sentence_transformer")
+
+
+def get_nlp():
+    return get("spacy")
+
+
+def get_ner():
+    return get("ner")
+
+
+def get_sentencizer():
+    return get("sentencizer")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load models and report load time and memory.")
+    parser.add_argument("names", nargs="*", help=f"Resources to load (default: all of {', '.join(_loaders)})")
+    args = parser.parse_args(argv)
+    print(json.dumps(warmup(args.names), indent=2))
+
+
+if __name__ == "__main__":
+    main()
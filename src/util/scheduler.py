@@ -0,0 +1,42 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config.config import LINKING_WORKERS
+
+
+# Bounded worker pool for independent I/O-bound lookups. Submitting a key that
+# is already in flight returns the pending future instead of a second call.
+class Scheduler:
+
+    def __init__(self, max_workers=LINKING_WORKERS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="scheduler"
+        )
+        self._inflight = {}
+        self._lock = threading.RLock()
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(fn, *args)
+                self._inflight[key] = future
+                future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def map_unique(self, namespace, fn, keys):
+        futures = {
+            key: self.submit((namespace, key), fn, key) for key in dict.fromkeys(keys)
+        }
+        return {key: future.result() for key, future in futures.items()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+scheduler = Scheduler()
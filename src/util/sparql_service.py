@@ -1,6 +1,11 @@
-import requests
-import time
+import asyncio
+import atexit
 import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
 
 from src.config.config import (
     logger,
@@ -9,7 +14,19 @@ from src.config.config import (
     TIMEOUT,
     MAX_RETRIES,
     BASE_DELAY,
+    MAX_DELAY,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_CONCURRENCY,
 )
+from src.util.cassette import MISS, get_cassette
+from src.util.metrics import metrics
+
+# One event loop in a background thread owns the pooled client, so that sync
+# callers on any thread share keep-alive connections and the concurrency limit.
+_loop = None
+_client = None
+_semaphore = None
+_lock = threading.Lock()
 
 
 def get_headers(rotating_user_agent=True):
@@ -24,22 +41,114 @@ def get_headers(rotating_user_agent=True):
     }
 
 
-def execute_request_with_retries(url, params, rotating_user_agent):
+def _get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="http-client", daemon=True
+            ).start()
+        return _loop
+
+
+def _get_client():
+    # Only called from coroutines running on _loop
+    global _client, _semaphore
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            ),
+        )
+        _semaphore = asyncio.Semaphore(HTTP_CONCURRENCY)
+    return _client
+
+
+def _retry_after(error):
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    # Exponential backoff with equal jitter, capped at MAX_DELAY
+    delay = min(MAX_DELAY, BASE_DELAY * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def execute_request_async(url, params, rotating_user_agent):
+    cassette = get_cassette()
+    if cassette is None:
+        return await _request(url, params, rotating_user_agent)
+    # Cassette files are read and written off the event loop, so replayed
+    # requests don't hold up the other in-flight requests
+    if cassette.mode == "replay":
+        response = await asyncio.to_thread(cassette.lookup, url, params)
+        if response is not MISS:
+            return response
+        if cassette.strict:
+            raise cassette.miss(url, params)
+    response = await _request(url, params, rotating_user_agent)
+    await asyncio.to_thread(cassette.record, url, params, response)
+    return response
+
+
+async def _request(url, params, rotating_user_agent):
+    client = _get_client()
     headers = get_headers(rotating_user_agent)
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = requests.get(url, headers=headers, params=params, timeout=TIMEOUT)
+            async with _semaphore:
+                metrics.inc("http_requests")
+                resp = await client.get(url, headers=headers, params=params)
             resp.raise_for_status()
             return resp.json()
         except Exception as e:
             if attempt == MAX_RETRIES:
+                metrics.inc("http_failures")
                 raise
-            wait = BASE_DELAY * attempt
+            metrics.inc("http_retries")
+            retry_after = _retry_after(e)
+            wait = min(MAX_DELAY, retry_after) if retry_after is not None else _backoff(attempt)
             logger.warning(
-                f"Request failed (attempt {attempt}): {e}. Retrying in {wait}s…"
+                "Request failed (attempt %s): %s. Retrying in %.1fs…", attempt, e, wait
             )
-            time.sleep(wait)
+            await asyncio.sleep(wait)
+
+
+async def run_sparql_async(url, query, rotating_user_agent):
+    return await execute_request_async(url, {"query": query}, rotating_user_agent)
+
+
+def run_async(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def execute_request_with_retries(url, params, rotating_user_agent):
+    return run_async(execute_request_async(url, params, rotating_user_agent))
 
 
 def run_sparql(url, query, rotating_user_agent):
     return execute_request_with_retries(url, {"query": query}, rotating_user_agent)
+
+
+@atexit.register
+def close():
+    global _client
+    if _loop is None or _client is None:
+        return
+    client, _client = _client, None
+    asyncio.run_coroutine_threadsafe(client.aclose(), _loop).result(timeout=TIMEOUT)
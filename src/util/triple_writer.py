@@ -0,0 +1,119 @@
+import json
+import os
+from abc import ABC, abstractmethod
+
+WIKIDATA_ENTITY_PREFIX = "http://www.wikidata.org/entity/"
+
+
+def is_iri(term):
+    return isinstance(term, str) and term.startswith(("http://", "https://"))
+
+
+def _nt_literal(text):
+    escaped = (
+        text.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+    return f'"{escaped}"'
+
+
+def _nt_term(term):
+    return f"<{term}>" if is_iri(term) else _nt_literal(str(term))
+
+
+def _ttl_term(term):
+    if is_iri(term) and term.startswith(WIKIDATA_ENTITY_PREFIX):
+        local = term[len(WIKIDATA_ENTITY_PREFIX):]
+        if local.isalnum():
+            return f"wd:{local}"
+    return _nt_term(term)
+
+
+# Writers append to the output file and report their byte offset after a flush,
+# which the run checkpoint records so a resumed run can truncate partial output.
+class TripleWriter(ABC):
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.file = open(path, mode="a+b")
+        self.file.truncate(offset)
+        self.file.seek(offset)
+        self.written = 0
+        self.skipped = 0
+        if offset == 0:
+            self._write(self.header())
+
+    def header(self):
+        return ""
+
+    def _write(self, text):
+        if text:
+            self.file.write(text.encode("utf-8"))
+
+    @abstractmethod
+    def write(self, doc_id, triples):
+        pass
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class NTriplesWriter(TripleWriter):
+
+    def format_triple(self, subj, pred, obj):
+        return f"{_nt_term(subj)} <{pred}> {_nt_term(obj)} .\n"
+
+    def write(self, doc_id, triples):
+        lines = []
+        for subj, pred, obj in triples:
+            # RDF needs IRI subjects and predicates; unlinked triples only go to JSONL
+            if not (is_iri(subj) and is_iri(pred)):
+                self.skipped += 1
+                continue
+            lines.append(self.format_triple(subj, pred, obj))
+        self._write("".join(lines))
+        self.written += len(lines)
+
+
+class TurtleWriter(NTriplesWriter):
+
+    def header(self):
+        return f"@prefix wd: <{WIKIDATA_ENTITY_PREFIX}> .\n\n"
+
+    def format_triple(self, subj, pred, obj):
+        return f"{_ttl_term(subj)} {_ttl_term(pred)} {_ttl_term(obj)} .\n"
+
+
+class JsonlWriter(TripleWriter):
+
+    def write(self, doc_id, triples):
+        record = {"id": doc_id, "triples": [list(triple) for triple in triples]}
+        self._write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.written += len(triples)
+
+
+WRITERS = {
+    "nt": NTriplesWriter,
+    "ttl": TurtleWriter,
+    "jsonl": JsonlWriter,
+}
+
+
+def detect_format(path):
+    if path.endswith(".ttl"):
+        return "ttl"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "nt"
+
+
+def open_writer(path, output_format="auto", offset=0):
+    output_format = detect_format(path) if output_format == "auto" else output_format
+    return WRITERS[output_format](path, offset)
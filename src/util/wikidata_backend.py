@@ -0,0 +1,401 @@
+import argparse
+import bz2
+import gzip
+import json
+import os
+import sqlite3
+import threading
+
+from src.config.config import (
+    logger,
+    WIKIDATA_API_URL,
+    WIKIDATA_SPARQL_URL,
+    WIKIDATA_BACKEND,
+    LOCAL_WIKIDATA_DB,
+    WBGETENTITIES_MAX_IDS,
+    CLASS_QUERY_MAX_IDS,
+)
+from src.config.query import build_class_query, build_superclass_query
+from src.util.sparql_service import execute_request_with_retries, run_sparql
+from src.util.batcher import MicroBatcher
+
+# Both backends answer the same four lookups:
+#   search_entities(term, language, limit) -> [{"id", "label"}], wbsearchentities-style
+#   get_entities(qids, language)           -> {qid: {"label", "aliases"}}
+#   get_classes(qid)                       -> [class QIDs] via P31
+#   get_superclasses(qids)                 -> {qid: {superclass QIDs}} one P279 level up
+# and name their data `source`, which keys the QID cache (a rebuilt local store
+# is a new source).
+
+
+# Request parameters of the Wikidata API calls, shared with the hand-built
+# benchmark recording (benchmarks/build_recording.py)
+def search_params(term, language, limit):
+    return {
+        "action": "wbsearchentities",
+        "search": term,
+        "language": language,
+        "format": "json",
+        "limit": limit,
+    }
+
+
+def entities_params(qids, language):
+    return {
+        "action": "wbgetentities",
+        "ids": "|".join(qids),
+        "props": "aliases|labels",
+        "languages": language,
+        "format": "json",
+    }
+
+
+# wbgetentities and P31 lookups from concurrent callers are coalesced by
+# micro-batchers into one request per window (up to the per-request ID limit).
+class RemoteBackend:
+
+    def __init__(self):
+        self.source = "remote"
+        self._entity_batchers = {}
+        self._batchers_lock = threading.Lock()
+        self._class_batcher = MicroBatcher(
+            self._fetch_classes, CLASS_QUERY_MAX_IDS, default=[], name="p31-batcher"
+        )
+
+    def search_entities(self, term, language, limit):
+        search = execute_request_with_retries(
+            url=WIKIDATA_API_URL,
+            params=search_params(term, language, limit),
+            rotating_user_agent=False,
+        )
+        return [
+            {"id": item["id"], "label": item.get("label", "")}
+            for item in search.get("search", [])
+        ]
+
+    def _entity_batcher(self, language):
+        with self._batchers_lock:
+            batcher = self._entity_batchers.get(language)
+            if batcher is None:
+                batcher = MicroBatcher(
+                    lambda qids: self._fetch_entities(qids, language),
+                    WBGETENTITIES_MAX_IDS,
+                    name=f"wbgetentities-{language}",
+                )
+                self._entity_batchers[language] = batcher
+            return batcher
+
+    def _fetch_entities(self, qids, language):
+        entities = execute_request_with_retries(
+            url=WIKIDATA_API_URL, params=entities_params(qids, language), rotating_user_agent=False
+        ).get("entities", {})
+
+        out = {}
+        for qid, ent in entities.items():
+            out[qid] = {
+                "label": ent.get("labels", {}).get(language, {}).get("value"),
+                "aliases": [a["value"] for a in ent.get("aliases", {}).get(language, [])],
+            }
+        return out
+
+    def get_entities(self, qids, language):
+        entities = self._entity_batcher(language).get_many(qids)
+        return {qid: ent for qid, ent in entities.items() if ent is not None}
+
+    def _fetch_classes(self, qids):
+        data = run_sparql(WIKIDATA_SPARQL_URL, build_class_query(qids), rotating_user_agent=False)
+        classes = {}
+        for item in data["results"]["bindings"]:
+            if "item" in item and "class" in item:
+                qid = item["item"]["value"].split("/")[-1]
+                classes.setdefault(qid, []).append(item["class"]["value"].split("/")[-1])
+        return classes
+
+    def get_classes(self, qid):
+        return self._class_batcher.get(qid)
+
+    def get_superclasses(self, qids):
+        qids = list(qids)
+        if not qids:
+            return {}
+        data = run_sparql(
+            WIKIDATA_SPARQL_URL, build_superclass_query(qids), rotating_user_agent=False
+        )
+        superclasses = {qid: set() for qid in qids}
+        for item in data["results"]["bindings"]:
+            if "class" in item and "superclass" in item:
+                qid = item["class"]["value"].split("/")[-1]
+                superclasses.setdefault(qid, set()).add(
+                    item["superclass"]["value"].split("/")[-1]
+                )
+        return superclasses
+
+    def close(self):
+        with self._batchers_lock:
+            batchers = [self._class_batcher, *self._entity_batchers.values()]
+            self._entity_batchers = {}
+        for batcher in batchers:
+            batcher.close()
+
+
+LOCAL_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS labels (
+        qid TEXT NOT NULL, language TEXT NOT NULL, label TEXT NOT NULL,
+        PRIMARY KEY (qid, language)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS aliases (
+        qid TEXT NOT NULL, language TEXT NOT NULL, alias TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS terms (
+        term TEXT NOT NULL, language TEXT NOT NULL, qid TEXT NOT NULL, popularity INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS instance_of (
+        qid TEXT NOT NULL, class TEXT NOT NULL, PRIMARY KEY (qid, class)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS subclass_of (
+        qid TEXT NOT NULL, superclass TEXT NOT NULL, PRIMARY KEY (qid, superclass)
+    ) WITHOUT ROWID;
+"""
+
+LOCAL_INDEXES = """
+    CREATE INDEX IF NOT EXISTS aliases_qid ON aliases (qid, language);
+    CREATE INDEX IF NOT EXISTS terms_term ON terms (language, term, popularity);
+"""
+
+# SQLite limits the number of bound parameters per statement
+MAX_SQL_PARAMS = 500
+
+
+def normalize_term(term):
+    return " ".join(term.lower().split())
+
+
+def _chunks(items, n):
+    items = list(items)
+    for i in range(0, len(items), n):
+        yield items[i : i + n]
+
+
+class LocalBackend:
+
+    def __init__(self, path=LOCAL_WIKIDATA_DB):
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"Local Wikidata store not found at {path}; "
+                "build it with `python -m src.util.wikidata_backend build`."
+            )
+        self.path = path
+        self.source = f"local:{os.stat(path).st_mtime_ns}"
+        self._local = threading.local()
+
+    def _connection(self):
+        # SQLite connections are per thread; the store is opened read-only
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def search_entities(self, term, language, limit):
+        term = normalize_term(term)
+        if not term:
+            return []
+        # Prefix match on the label/alias index, exact matches and popular entities first
+        rows = self._connection().execute(
+            """
+            SELECT t.qid, COALESCE(l.label, '')
+            FROM terms t LEFT JOIN labels l ON l.qid = t.qid AND l.language = t.language
+            WHERE t.language = ? AND t.term >= ? AND t.term < ?
+            GROUP BY t.qid
+            ORDER BY MAX(t.term = ?) DESC, MAX(t.popularity) DESC
+            LIMIT ?
+            """,
+            (language, term, term + "\U0010ffff", term, limit),
+        ).fetchall()
+        return [{"id": qid, "label": label} for qid, label in rows]
+
+    def get_entities(self, qids, language):
+        out = {qid: {"label": None, "aliases": []} for qid in qids}
+        conn = self._connection()
+        for chunk in _chunks(out, MAX_SQL_PARAMS):
+            marks = ",".join("?" * len(chunk))
+            for qid, label in conn.execute(
+                f"SELECT qid, label FROM labels WHERE language = ? AND qid IN ({marks})",
+                (language, *chunk),
+            ):
+                out[qid]["label"] = label
+            for qid, alias in conn.execute(
+                f"SELECT qid, alias FROM aliases WHERE language = ? AND qid IN ({marks}) "
+                "ORDER BY rowid",
+                (language, *chunk),
+            ):
+                out[qid]["aliases"].append(alias)
+        return out
+
+    def get_classes(self, qid):
+        rows = self._connection().execute(
+            "SELECT class FROM instance_of WHERE qid = ?", (qid,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_superclasses(self, qids):
+        superclasses = {qid: set() for qid in qids}
+        conn = self._connection()
+        for chunk in _chunks(superclasses, MAX_SQL_PARAMS):
+            marks = ",".join("?" * len(chunk))
+            for qid, superclass in conn.execute(
+                f"SELECT qid, superclass FROM subclass_of WHERE qid IN ({marks})", chunk
+            ):
+                superclasses[qid].add(superclass)
+        return superclasses
+
+
+def _open_dump(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode="rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, mode="rt", encoding="utf-8")
+    return open(path, mode="r", encoding="utf-8")
+
+
+def _iter_dump_entities(path):
+    # Wikidata JSON dumps are one JSON array with one entity per line
+    with _open_dump(path) as file:
+        for line in file:
+            line = line.strip().rstrip(",")
+            if not line or line in ("[", "]"):
+                continue
+            yield json.loads(line)
+
+
+def _claim_targets(entity, prop):
+    targets = []
+    for claim in entity.get("claims", {}).get(prop, []):
+        value = claim.get("mainsnak", {}).get("datavalue", {}).get("value")
+        if isinstance(value, dict) and "id" in value:
+            targets.append(value["id"])
+    return targets
+
+
+def build_local_store(dump_path, db_path=LOCAL_WIKIDATA_DB, languages=("en",), batch_size=10000):
+    logger.info(f"Building local Wikidata store {db_path} from {dump_path}")
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Built next to the store and swapped in at the end: a rebuild replaces the
+    # old rows instead of adding to them, and readers never see a partial store
+    tmp_path = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(LOCAL_SCHEMA)
+
+    rows = {"labels": [], "aliases": [], "terms": [], "instance_of": [], "subclass_of": []}
+    inserts = {
+        "labels": "INSERT OR REPLACE INTO labels VALUES (?, ?, ?)",
+        "aliases": "INSERT INTO aliases VALUES (?, ?, ?)",
+        "terms": "INSERT INTO terms VALUES (?, ?, ?, ?)",
+        "instance_of": "INSERT OR IGNORE INTO instance_of VALUES (?, ?)",
+        "subclass_of": "INSERT OR IGNORE INTO subclass_of VALUES (?, ?)",
+    }
+
+    def flush():
+        for table, values in rows.items():
+            conn.executemany(inserts[table], values)
+            values.clear()
+        conn.commit()
+
+    try:
+        count = 0
+        for entity in _iter_dump_entities(dump_path):
+            qid = entity.get("id")
+            if not qid or not qid.startswith("Q"):
+                continue
+            popularity = len(entity.get("sitelinks", {}))
+
+            for language in languages:
+                terms = set()
+                label = entity.get("labels", {}).get(language, {}).get("value")
+                if label:
+                    rows["labels"].append((qid, language, label))
+                    terms.add(normalize_term(label))
+                for alias in entity.get("aliases", {}).get(language, []):
+                    rows["aliases"].append((qid, language, alias["value"]))
+                    terms.add(normalize_term(alias["value"]))
+                rows["terms"].extend((term, language, qid, popularity) for term in terms if term)
+
+            rows["instance_of"].extend((qid, cls) for cls in _claim_targets(entity, "P31"))
+            rows["subclass_of"].extend((qid, sup) for sup in _claim_targets(entity, "P279"))
+
+            count += 1
+            if count % batch_size == 0:
+                flush()
+                logger.info(f"Stored {count} entities.")
+
+        flush()
+        conn.executescript(LOCAL_INDEXES)
+        conn.execute("ANALYZE")
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, db_path)
+    logger.info(f"Finished building local Wikidata store with {count} entities.")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if WIKIDATA_BACKEND == "local":
+                _backend = LocalBackend(LOCAL_WIKIDATA_DB)
+            elif WIKIDATA_BACKEND == "remote":
+                _backend = RemoteBackend()
+            else:
+                raise ValueError(f"Unknown Wikidata backend: {WIKIDATA_BACKEND}")
+            logger.info(f"Using {type(_backend).__name__} for Wikidata lookups.")
+        return _backend
+
+
+def set_backend(backend):
+    # Installs a backend (None to build one from the config again) and returns the previous one
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+        return previous
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local Wikidata store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build the store from a Wikidata JSON dump subset.")
+    build.add_argument("dump", help="Wikidata JSON dump (.json, .json.gz or .json.bz2)")
+    build.add_argument("--db", default=LOCAL_WIKIDATA_DB)
+    build.add_argument("--languages", nargs="+", default=["en"])
+
+    search = commands.add_parser("search", help="Run a wbsearchentities-style lookup.")
+    search.add_argument("term")
+    search.add_argument("--db", default=LOCAL_WIKIDATA_DB)
+    search.add_argument("--language", default="en")
+    search.add_argument("--limit", type=int, default=10)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        build_local_store(args.dump, args.db, tuple(args.languages))
+    elif args.command == "search":
+        backend = LocalBackend(args.db)
+        items = backend.search_entities(args.term, args.language, args.limit)
+        entities = backend.get_entities([item["id"] for item in items], args.language)
+        for item in items:
+            print(json.dumps({**item, **entities[item["id"]], "classes": backend.get_classes(item["id"])}))
+
+
+if __name__ == "__main__":
+    main()
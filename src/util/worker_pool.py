@@ -0,0 +1,174 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.config.config import logger, DOC_BATCH_SIZE
+from src.util.metrics import metrics
+
+SHARED_ARRAYS = (
+    "label_embs",
+    "description_embs",
+    "alias_embs",
+    "alias_offsets",
+    "statement_embs",
+    "statement_offsets",
+)
+WORKER_RESOURCES = ["sentence_transformer", "spacy", "ner", "constraint_index"]
+
+# Shared-memory blocks attached by this worker process; kept referenced so the
+# arrays viewing them stay valid.
+_attached = []
+
+
+def share_property_index(index):
+    # A memory-mapped store is mapped again by each worker, sharing the page cache
+    store_path = getattr(index, "store_path", None)
+    if store_path:
+        return [], {"store": store_path}
+
+    # Otherwise the index matrices are copied into shared memory once, in the parent
+    blocks, spec = [], {}
+    for name in SHARED_ARRAYS:
+        array = np.ascontiguousarray(getattr(index, name))
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    spec["properties"] = index.properties
+    spec["alias_properties"] = index.alias_properties
+    spec["statement_properties"] = index.statement_properties
+    return blocks, spec
+
+
+def attach_property_index(spec):
+    from src.steps.relationship_extraction.property_index import PropertyIndex
+
+    if "store" in spec:
+        from src.util.embedding_store import load_store
+
+        return load_store(spec["store"])
+
+    arrays = {}
+    for name in SHARED_ARRAYS:
+        block_name, shape, dtype = spec[name]
+        # The parent owns and unlinks the blocks; workers only attach
+        try:
+            block = shared_memory.SharedMemory(name=block_name, track=False)
+        except TypeError:
+            # Python < 3.13 has no track flag; spawned workers share the parent's
+            # resource tracker, so attaching only re-registers the same name
+            block = shared_memory.SharedMemory(name=block_name)
+        _attached.append(block)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+    return PropertyIndex(
+        spec["properties"],
+        arrays["label_embs"],
+        arrays["description_embs"],
+        arrays["alias_embs"],
+        arrays["alias_offsets"],
+        spec["alias_properties"],
+        arrays["statement_embs"],
+        arrays["statement_offsets"],
+        spec["statement_properties"],
+    )
+
+
+def thread_environment(threads):
+    # Read by OpenMP, MKL and OpenBLAS when they load, and by tokenizers
+    return {
+        "OMP_NUM_THREADS": str(threads),
+        "MKL_NUM_THREADS": str(threads),
+        "OPENBLAS_NUM_THREADS": str(threads),
+        "TOKENIZERS_PARALLELISM": "false",
+    }
+
+
+def _init_worker(index_spec, threads):
+    # The BLAS and tokenizer limits come from the environment inherited from
+    # WorkerPool; torch's intra-op pool is set here as well
+    import torch
+
+    torch.set_num_threads(threads)
+
+    from src.util import registry
+
+    registry.provide("property_index", attach_property_index(index_spec))
+    registry.warmup(WORKER_RESOURCES)
+    logger.info(f"Worker {os.getpid()} ready with {threads} threads.")
+
+
+def _process_shard(texts, batch_size):
+    from src import pipeline
+    from src.steps.relationship_extraction.class_hierarchy import class_hierarchy
+
+    # Each shard reports its own metrics; the parent adds them up
+    metrics.reset()
+    results = pipeline.extract_triples_batch(texts, batch_size)
+    class_hierarchy.save()
+    return results, metrics.snapshot()
+
+
+# Runs extract_triples_batch on document shards in worker processes. Each
+# worker loads the models once; the property index is shared between them.
+class WorkerPool:
+
+    def __init__(self, workers, threads_per_worker=None, batch_size=DOC_BATCH_SIZE):
+        from src.util import registry
+
+        self.workers = workers
+        self.batch_size = batch_size
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self._blocks, index_spec = share_property_index(registry.get("property_index"))
+        # Spawned workers load numpy (and its BLAS) while unpickling the
+        # initializer, before it runs, so the thread limits must already be in
+        # the environment they inherit. The parent's numpy is loaded already
+        # and keeps its own thread count.
+        os.environ.update(thread_environment(self.threads))
+        # spawn: forking a process that already runs torch and I/O threads is unsafe
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(index_spec, self.threads),
+        )
+        logger.info(f"Started {workers} workers with {self.threads} threads each.")
+
+    def _result(self, future):
+        triples_batch, snapshot = future.result()
+        metrics.merge(snapshot)
+        return triples_batch
+
+    def imap(self, shards):
+        # Yields each shard's triples in input order, keeping at most two shards
+        # per worker in flight so memory stays bounded on long streams
+        pending = deque()
+        for texts in shards:
+            pending.append(self._executor.submit(_process_shard, list(texts), self.batch_size))
+            if len(pending) >= 2 * self.workers:
+                yield self._result(pending.popleft())
+        while pending:
+            yield self._result(pending.popleft())
+
+    def map(self, texts):
+        texts = list(texts)
+        shards = (texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size))
+        return [triples for shard in self.imap(shards) for triples in shard]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()